@@ -2,7 +2,7 @@ from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
 
-from . import models
+from . import images, models
 
 
 
@@ -40,7 +40,8 @@ class ReviewAdmin(admin.ModelAdmin):
 
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'status']
+    list_display = ['id', 'status', 'item_count', 'total_price']
+    readonly_fields = ['total_price', 'item_count']
     inlines = [OrderItemInline]
 
 
@@ -58,7 +59,8 @@ class ProductImageInline(admin.TabularInline):
 
     def thumbnail(self, instance):
         if instance.image.name != '':
-            return format_html(f"<img src='{instance.image.url}' style='width: 100px; object-fit: cover;'></img>")
+            url = images.derivative_urls(instance).get('thumbnail', instance.image.url)
+            return format_html(f"<img src='{url}' style='width: 100px; object-fit: cover;'></img>")
 
 
 @admin.register(models.Product)
@@ -66,6 +68,7 @@ class ProductAdmin(admin.ModelAdmin):
     inlines = [ProductImageInline]
     prepopulated_fields = {'slug': ['title']}
     list_display = ['title', 'unit_price', 'inventory', 'average_rating']
+    list_select_related = ['rating_stats']
 
 @admin.register(models.Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -0,0 +1,59 @@
+"""
+JWT authentication that resolves the user from the cache.
+
+The user named by a token is kept in the cache for a short while together with
+their customer, so most authenticated requests need no query to find either.
+Entries are dropped whenever the user or customer is saved or deleted.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import models
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop the cached user now and again once the current transaction commits."""
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user, _ = result
+            customer = getattr(user, '_cached_customer', None)
+            if customer is not None:
+                # Seed the request so resolvers.get_customer() needs no query.
+                request._customer = customer
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is not None:
+            user, customer = cached
+        else:
+            # Inactive or missing users raise here and are never cached.
+            user = super().get_user(validated_token)
+            customer = models.Customer.objects.filter(user=user).first()
+            if customer is not None:
+                customer.user = user
+            cache.set(key, (user, customer), settings.AUTH_USER_CACHE_TIMEOUT)
+
+        user._cached_customer = customer
+        return user
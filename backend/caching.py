@@ -0,0 +1,195 @@
+"""
+Response cache for the public catalog endpoints.
+
+Cached responses are keyed on a catalog version that is bumped whenever
+catalog data changes, so stale entries are never served and simply age out
+of the cache. Only one request recomputes a missing entry at a time; the
+others wait briefly for its result instead of all hitting the database.
+That lock relies on ``cache.add`` and the version on ``cache.incr``, which
+are only atomic on backends such as Redis or Memcached; on the file based
+cache both are best effort.
+
+Stock levels change with every order, so they have a version of their own
+that moves at most once every ``CATALOG_STOCK_REFRESH_INTERVAL`` seconds:
+under checkout load cached pages show stock a little late rather than being
+rebuilt once per order.
+
+The versions and the time of the last bump make the ETag and Last-Modified
+validators, so clients revalidating an unchanged page get a 304 without the
+view or the cache entry being touched.
+"""
+import functools
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+STOCK_VERSION_KEY = 'catalog:stock:version'
+STOCK_CHANGED_KEY = 'catalog:stock:changed'
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 0 so an evicted version never
+        # points back at responses cached under an earlier one.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY, 0)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+
+
+def invalidate_catalog():
+    """
+    Bump the catalog version now and again once the current transaction
+    commits, so a page read before the commit is not cached under the new one.
+    """
+    bump_catalog_version()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump_catalog_version)
+
+
+def stock_changed():
+    """Record that orders changed stock levels; cached pages pick it up with `stock_version`."""
+    cache.set(STOCK_CHANGED_KEY, time.time(), None)
+
+
+def stock_version():
+    """
+    The time stock changes were last published to cached pages. A change is
+    published once the previous publication is the refresh interval old.
+    """
+    state = cache.get_many([STOCK_VERSION_KEY, STOCK_CHANGED_KEY])
+    version, changed = state.get(STOCK_VERSION_KEY), state.get(STOCK_CHANGED_KEY, 0)
+    now = time.time()
+    if version is None:
+        # Like the catalog version, never restart from a value used before.
+        cache.add(STOCK_VERSION_KEY, now, None)
+        version = cache.get(STOCK_VERSION_KEY, now)
+    if changed > version and now - version >= settings.CATALOG_STOCK_REFRESH_INTERVAL:
+        version = now
+        cache.set(STOCK_VERSION_KEY, version, None)
+        cache.set(CATALOG_MODIFIED_KEY, int(now), None)
+    return version
+
+
+def catalog_last_modified():
+    """Unix time of the last catalog change, or of the first call after the cache lost it."""
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        cache.add(CATALOG_MODIFIED_KEY, int(time.time()), None)
+        modified = cache.get(CATALOG_MODIFIED_KEY, int(time.time()))
+    return modified
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def not_modified(request, etag, last_modified, private=False):
+    """
+    Return a 304 response when the client's copy matches ``etag`` or is not
+    older than ``last_modified`` (a Unix time, or None to rely on the ETag
+    alone), otherwise None.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified, private)
+    return response
+
+
+def set_validators(response, etag, last_modified, private=False):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the body but must check back before reusing it.
+    if private:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True, public=True)
+    return response
+
+
+def normalized_query(query_params):
+    items = sorted(
+        (key, value) for key in query_params for value in query_params.getlist(key) if value != ''
+    )
+    return urlencode(items)
+
+
+def response_cache_key(view_name, kwargs, query_params):
+    raw = f"{view_name}:{sorted(kwargs.items())}:{normalized_query(query_params)}"
+    return f"catalog:{catalog_version()}:{stock_version()}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        if cache.get(f"{key}:lock") is None:
+            break
+    return None
+
+
+def cache_catalog_response(view_method):
+    """Cache successful GET responses of a viewset method under the current catalog version."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return view_method(self, request, *args, **kwargs)
+
+        view_name = f"{type(self).__name__}.{view_method.__name__}"
+        if getattr(self, 'use_keyset_pagination', lambda: False)():
+            # Keyset pages are shaped differently from numbered ones, also for
+            # an empty `?cursor=` that the normalized query leaves out.
+            view_name += ':keyset'
+        key = response_cache_key(view_name, kwargs, request.query_params)
+        etag, last_modified = make_etag(key), catalog_last_modified()
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        cached = cache.get(key)
+
+        if cached is None:
+            lock_key = f"{key}:lock"
+            owns_lock = cache.add(lock_key, 1, LOCK_TIMEOUT)
+            if not owns_lock:
+                cached = _wait_for(key)
+
+        if cached is None:
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, (response.status_code, response.data), settings.CATALOG_CACHE_TIMEOUT)
+                    set_validators(response, etag, last_modified)
+                return response
+            finally:
+                if owns_lock:
+                    cache.delete(lock_key)
+
+        status_code, data = cached
+        return set_validators(Response(data, status=status_code), etag, last_modified)
+
+    return wrapper
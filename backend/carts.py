@@ -0,0 +1,169 @@
+"""
+Cache-backed cart storage.
+
+With ``CART_STORAGE = 'cache'`` each customer's cart lives in a cache entry
+holding its items and a snapshot of the products in it, so listing a cart
+needs no database round trips. A quantity change is recorded as the item's
+``pending_quantity`` with a single-row update and shown from a per-item cache
+key; the costly part, checking and reserving the stock and making it the
+item's quantity, is written behind by a background job, and flushed
+synchronously before checkout or any other database write to the cart.
+
+Pending changes live in the database, so evicting cache entries can never
+lose them, and each change is its own write, so concurrent changes never
+overwrite each other. Product snapshots are tied to the catalog and stock
+versions and refreshed when either changes.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.functions import Coalesce
+from rest_framework.generics import get_object_or_404
+
+from . import caching, exceptions, jobs, models, reservations, serializers
+
+logger = logging.getLogger(__name__)
+
+
+def cache_enabled():
+    return settings.CART_STORAGE == 'cache'
+
+
+class CartStore:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.key = f"cart:{user_id}"
+
+    def load(self):
+        entry = cache.get(self.key)
+        if entry is None or 'token' not in entry:
+            # Also reloads entries cached before quantities moved to their own keys.
+            entry = self._load_from_db()
+            self._save(entry)
+        version = [caching.catalog_version(), caching.stock_version()]
+        if entry['products_version'] != version:
+            self._refresh_products(entry)
+            entry['products_version'] = version
+            self._save(entry)
+        return entry
+
+    def _save(self, entry):
+        cache.set(self.key, entry, settings.CART_CACHE_TIMEOUT)
+
+    def _load_from_db(self):
+        customer = get_object_or_404(models.Customer, user_id=self.user_id)
+        cart = models.Cart.objects.filter(customer=customer).first()
+        items = {}
+        if cart is not None:
+            for item_id, product_id, quantity in models.CartItem.objects.filter(cart=cart).values_list(
+                'id', 'product_id', Coalesce('pending_quantity', 'quantity')
+            ):
+                items[item_id] = {'id': item_id, 'product_id': product_id, 'quantity': quantity}
+        return {
+            'customer_id': customer.pk,
+            'cart_id': cart.pk if cart is not None else None,
+            'items': items,
+            # Names this copy's per-item quantity keys, so keys left over from
+            # an earlier copy never apply to a reloaded one.
+            'token': uuid.uuid4().hex,
+            'products': {},
+            'products_version': None,
+        }
+
+    def _quantity_key(self, entry, item_id):
+        return f"{self.key}:{entry['token']}:{item_id}"
+
+    def _quantities(self, entry):
+        """Each item's quantity, including changes made since the entry was loaded."""
+        keys = {self._quantity_key(entry, item_id): item_id for item_id in entry['items']}
+        changed = {keys[key]: quantity for key, quantity in cache.get_many(list(keys)).items()}
+        return {item_id: changed.get(item_id, item['quantity']) for item_id, item in entry['items'].items()}
+
+    def _refresh_products(self, entry):
+        product_ids = {item['product_id'] for item in entry['items'].values()}
+        products = models.Product.objects.filter(pk__in=product_ids).prefetch_related(
+            Prefetch('images', queryset=models.ProductImage.objects.order_by('pk'))
+        )
+        entry['products'] = {
+            product.pk: serializers.SimpleProductSerializer(product).data for product in products
+        }
+
+    def items(self):
+        entry = self.load()
+        quantities = self._quantities(entry)
+        return [self._render(entry, item, quantities[item_id]) for item_id, item in entry['items'].items()]
+
+    def item(self, item_id):
+        entry = self.load()
+        item = entry['items'][item_id]
+        quantity = cache.get(self._quantity_key(entry, item_id), item['quantity'])
+        return self._render(entry, item, quantity)
+
+    def _render(self, entry, item, quantity):
+        product = entry['products'].get(item['product_id'])
+        return {
+            'id': item['id'],
+            'product': product,
+            'quantity': quantity,
+            'total_price': quantity * product['unit_price'] if product else 0,
+        }
+
+    def set_quantity(self, item_id, quantity):
+        """Record a quantity change and schedule it to be written behind."""
+        entry = self.load()
+        item = entry['items'][item_id]
+        product = entry['products'].get(item['product_id'])
+        # Only a cheap check against the snapshot here; the stock is reserved
+        # for real when the change is written behind.
+        if product is None or quantity > product['inventory']:
+            raise exceptions.QuantityError()
+        if not models.CartItem.objects.filter(pk=item_id, cart_id=entry['cart_id']).update(pending_quantity=quantity):
+            # Removed since the entry was cached.
+            self.invalidate()
+            raise KeyError(item_id)
+        cache.set(self._quantity_key(entry, item_id), quantity, settings.CART_CACHE_TIMEOUT)
+        if cache.add(f"{self.key}:flush", 1, settings.CART_FLUSH_RETRY_AFTER):
+            jobs.submit(flush_cart, self.user_id)
+        return {**item, 'quantity': quantity}
+
+    def flush(self):
+        """
+        Reserve stock for the pending quantity changes and make them the items' quantities.
+
+        Raises `QuantityError` when the stock for one of them has run out since
+        it was accepted. Nothing is written then and the changes stay pending,
+        so checkout keeps failing until the client changes the quantity again
+        or removes the item.
+        """
+        # Cleared first, so a change made while flushing schedules a new flush.
+        cache.delete(f"{self.key}:flush")
+        pending = list(
+            models.CartItem.objects.filter(cart__customer__user_id=self.user_id, pending_quantity__isnull=False)
+            .values_list('pk', 'cart_id', 'product_id', 'pending_quantity')
+        )
+        if not pending:
+            return
+        with transaction.atomic():
+            for _, cart_id, product_id, quantity in pending:
+                reservations.hold(cart_id, product_id, quantity)
+            for item_id, _, _, quantity in pending:
+                # Compare-and-set, so a change made meanwhile stays pending for the next flush.
+                models.CartItem.objects.filter(pk=item_id, pending_quantity=quantity).update(
+                    quantity=quantity, pending_quantity=None
+                )
+        transaction.on_commit(self.invalidate)
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+
+def flush_cart(user_id):
+    try:
+        CartStore(user_id).flush()
+    except exceptions.QuantityError:
+        # Left pending; checkout reports the conflict to the client.
+        logger.info("Cart of user %s holds quantities that are no longer in stock", user_id)
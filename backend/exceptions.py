@@ -5,3 +5,13 @@ from rest_framework.exceptions import APIException
 class QuantityError(APIException):
     status_code = status.HTTP_409_CONFLICT
     default_detail = "Quantity is more than the product's inventory"
+
+
+class PaymentGatewayError(APIException):
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = "The payment gateway could not be reached, please try again"
+
+
+class OrderNumbersExhausted(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "No more order numbers are available today"
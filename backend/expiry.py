@@ -0,0 +1,74 @@
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import inventory, models
+
+
+@dataclass
+class ExpiryReport:
+    orders: int = 0
+    units: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def orders_per_second(self):
+        return self.orders / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"Cancelled {self.orders} pending orders and restored {self.units} units "
+            f"in {self.chunks} chunks, {self.seconds:.2f}s ({self.orders_per_second:.0f} orders/s)."
+        )
+
+
+def expire_pending_orders(chunk_size=None, now=None):
+    """
+    Cancel orders left awaiting payment past ``PENDING_ORDER_TIMEOUT`` and put
+    their stock back.
+
+    Orders are handled in chunks, each in its own short transaction: one locking
+    select, one status UPDATE and one inventory UPDATE covering every product in
+    the chunk. Orders locked by a concurrent payment or checkout are skipped
+    where the database supports SKIP LOCKED and picked up by the next run.
+    """
+    chunk_size = chunk_size or settings.ORDER_EXPIRY_CHUNK_SIZE
+    cutoff = (now or timezone.now()) - settings.PENDING_ORDER_TIMEOUT
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    report = ExpiryReport()
+    started = time.monotonic()
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            order_ids = list(
+                models.Order.objects.select_for_update(skip_locked=skip_locked)
+                .filter(status=models.Order.STATUS_AWAITING_PAYMENT, order_time__lte=cutoff, pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not order_ids:
+                break
+            last_id = order_ids[-1]
+
+            quantities = dict(
+                models.OrderItem.objects.filter(order_id__in=order_ids)
+                .values('product_id')
+                .annotate(quantity=Sum('quantity'))
+                .values_list('product_id', 'quantity')
+            )
+            report.orders += models.Order.objects.filter(
+                pk__in=order_ids, status=models.Order.STATUS_AWAITING_PAYMENT
+            ).update(status=models.Order.STATUS_CANCELLED, order_time=timezone.now())
+            inventory.restore_stock(quantities)
+
+        report.units += sum(quantities.values())
+        report.chunks += 1
+
+    report.seconds = time.monotonic() - started
+    return report
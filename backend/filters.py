@@ -1,8 +1,18 @@
+import datetime
+
 import django_filters
+from django.utils import timezone
 
 from . import models
 
 
+def start_of_day(value):
+    """Midnight in the current time zone at the start of ``value``'s local date."""
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return timezone.make_aware(datetime.datetime.combine(value, datetime.time.min))
+
+
 class ProductFilter(django_filters.FilterSet):
     class Meta:
         model = models.Product
@@ -20,6 +30,18 @@ class OrderFilter(django_filters.FilterSet):
         model = models.Order
         fields = ["order_time_min", "order_time_max", "status"]
 
-    order_time_min = django_filters.DateTimeFilter(field_name='order_time__date', lookup_expr="gte")
-    order_time_max = django_filters.DateTimeFilter(field_name='order_time__date', lookup_expr="lte")
+    # Whole days, compared as a range on order_time itself so order_time_idx is
+    # used; a lookup on order_time__date would cast every row.
+    order_time_min = django_filters.DateTimeFilter(method='filter_order_time_min')
+    order_time_max = django_filters.DateTimeFilter(method='filter_order_time_max')
     status = django_filters.CharFilter(field_name='status')
+
+    def filter_order_time_min(self, queryset, name, value):
+        # Also bounded above by tomorrow, which no order_time can reach. With an
+        # open-ended range SQLite walks the primary key backwards instead, which
+        # reads the whole table when no recent order is in the range.
+        tomorrow = start_of_day(timezone.localdate()) + datetime.timedelta(days=1)
+        return queryset.filter(order_time__gte=start_of_day(value), order_time__lt=tomorrow)
+
+    def filter_order_time_max(self, queryset, name, value):
+        return queryset.filter(order_time__lt=start_of_day(value) + datetime.timedelta(days=1))
@@ -0,0 +1,139 @@
+"""
+Product image uploads and their resized WebP derivatives.
+
+Uploads are decoded to temporary files and checked from their headers, then
+stored as sent; a Celery task then renders one WebP per entry in
+``settings.IMAGE_DERIVATIVE_WIDTHS`` next to the original and records them in
+``ProductImage.derivatives`` as ``{size: {'name', 'width', 'height'}}``.
+Images whose task was lost are rendered by a periodic sweep.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, ImageOps
+
+from . import caching, jobs, models
+
+DERIVATIVE_DIR = 'store/images/derivatives'
+
+# Base64 characters decoded per step; a multiple of 4 so steps split on whole bytes.
+DECODE_CHUNK_SIZE = 256 * 1024
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def decode_base64(data, name='upload'):
+    """
+    Decode base64 text into a temporary file a chunk at a time.
+
+    Only one chunk of decoded bytes is held in memory. The file's SHA-256 is
+    computed on the way and left on it as ``content_hash`` for the image
+    storage. Raises ``ValueError`` if the text is not valid base64.
+    """
+    file = TemporaryUploadedFile(name, 'application/octet-stream', 0, None)
+    sha = hashlib.sha256()
+    carry = ''
+    try:
+        for start in range(0, len(data), DECODE_CHUNK_SIZE):
+            text = carry + ''.join(data[start:start + DECODE_CHUNK_SIZE].split())
+            whole = len(text) - len(text) % 4
+            chunk = base64.b64decode(text[:whole], validate=True)
+            carry = text[whole:]
+            sha.update(chunk)
+            file.write(chunk)
+        if carry:
+            raise ValueError("Truncated base64 data")
+    except (binascii.Error, ValueError):
+        file.close()
+        raise ValueError("Invalid base64 data")
+    file.size = file.tell()
+    file.seek(0)
+    file.content_hash = sha.hexdigest()
+    return file
+
+
+def inspect(file):
+    """
+    Identify an uploaded image from its header without decoding the pixels.
+
+    Returns the file extension for its format. Raises ``ValueError`` for files
+    that are not a supported image or are larger than
+    ``settings.IMAGE_UPLOAD_MAX_DIMENSION`` on either side.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        # Pillow refuses headers claiming far more pixels than the limit below.
+        raise ValueError(f"Image is too large, the limit is {settings.IMAGE_UPLOAD_MAX_DIMENSION} pixels per side")
+    except Exception:
+        # Format plugins raise all sorts of errors on malformed headers; like
+        # DRF's ImageField, take any of them to mean the file is no image.
+        raise ValueError("Not an image")
+    finally:
+        file.seek(0)
+    if image_format not in EXTENSIONS:
+        raise ValueError(f"Unsupported image format {image_format}")
+    if max(width, height) > settings.IMAGE_UPLOAD_MAX_DIMENSION:
+        raise ValueError(f"Image is {width}x{height}, the limit is {settings.IMAGE_UPLOAD_MAX_DIMENSION} pixels per side")
+    return EXTENSIONS[image_format]
+
+
+def render(image, width):
+    """Return ``image`` scaled down to ``width`` pixels wide as WebP bytes and its final size."""
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=settings.IMAGE_DERIVATIVE_QUALITY, method=4)
+    return buffer.getvalue(), image.size
+
+
+def generate_derivatives(image_id):
+    """Render and store every derivative of a product image. Returns False if the image is gone."""
+    product_image = models.ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not product_image.image:
+        return False
+
+    storage = product_image.image.storage
+    with product_image.image.open('rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original = original.convert('RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(product_image.image.name))[0]
+    derivatives = {}
+    for size, width in settings.IMAGE_DERIVATIVE_WIDTHS.items():
+        content, (final_width, final_height) = render(original, width)
+        # Image storage is content addressed, so re-rendering reuses the same file.
+        name = storage.save(f'{DERIVATIVE_DIR}/{stem}-{size}.webp', ContentFile(content))
+        derivatives[size] = {'name': name, 'width': final_width, 'height': final_height}
+
+    # update() rather than save() so storing the result does not queue another job.
+    models.ProductImage.objects.filter(pk=image_id).update(derivatives=derivatives)
+    caching.invalidate_catalog()
+    return True
+
+
+def queue_derivatives(image_id):
+    """Have a Celery worker render the image's derivatives once the current transaction commits."""
+    from sb_backend.tasks import generate_image_derivatives
+    jobs.enqueue(generate_image_derivatives, image_id)
+
+
+def generate_missing_derivatives():
+    """Render the derivatives of every image that has none yet. Returns how many were rendered."""
+    image_ids = models.ProductImage.objects.filter(derivatives={}).order_by('pk').values_list('pk', flat=True)
+    return sum(generate_derivatives(image_id) for image_id in image_ids.iterator())
+
+
+def derivative_urls(product_image):
+    """Map each generated size to its storage URL."""
+    storage = product_image.image.storage
+    return {size: storage.url(entry['name']) for size, entry in (product_image.derivatives or {}).items()}
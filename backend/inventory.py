@@ -0,0 +1,49 @@
+import operator
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from . import caching, exceptions, models
+
+
+def lock_products(product_ids):
+    """
+    Lock the given product rows for the rest of the transaction.
+
+    Rows are always locked in primary key order so that two checkouts sharing
+    products cannot deadlock on each other.
+    """
+    return list(models.Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk'))
+
+
+def _inventory_change(deltas):
+    return Case(
+        *[When(pk=product_id, then=F('inventory') + delta) for product_id, delta in deltas.items()],
+        default=F('inventory'),
+        output_field=models.Product._meta.get_field('inventory'),
+    )
+
+
+def decrement_stock(quantities):
+    """
+    Take ``{product_id: quantity}`` out of inventory with a single UPDATE.
+
+    The update only matches products that still have enough stock, so if any
+    product is short nothing sensible can be committed and `QuantityError` is
+    raised for the caller's transaction to roll back.
+    """
+    enough_stock = reduce(operator.or_, (Q(pk=product_id, inventory__gte=quantity) for product_id, quantity in quantities.items()))
+    updated = models.Product.objects.filter(enough_stock).update(
+        inventory=_inventory_change({product_id: -quantity for product_id, quantity in quantities.items()})
+    )
+    if updated != len(quantities):
+        raise exceptions.QuantityError()
+    transaction.on_commit(caching.stock_changed)
+
+
+def restore_stock(quantities):
+    """Put ``{product_id: quantity}`` back into inventory with a single UPDATE."""
+    if quantities:
+        models.Product.objects.filter(pk__in=quantities).update(inventory=_inventory_change(quantities))
+        transaction.on_commit(caching.stock_changed)
@@ -0,0 +1,48 @@
+"""
+Small in-process background job runner, and a hand-off to Celery.
+
+Jobs are handed to a thread pool once the current transaction commits, so the
+request that queued them returns without waiting. They are best effort: a job
+lost with its process is redone by the periodic tasks or management commands
+that cover the same work. Work too heavy for a web worker goes to Celery
+with `enqueue` instead.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_JOB_WORKERS, thread_name_prefix='backend-jobs')
+    return _executor
+
+
+def _run(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background job %s failed", func.__name__)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args):
+    """Run ``func(*args)`` in the background after the current transaction commits."""
+    transaction.on_commit(lambda: _get_executor().submit(_run, func, args))
+
+
+def enqueue(task, *args):
+    """
+    Send the Celery ``task`` once the current transaction commits. A broker
+    that cannot be reached is logged instead of failing the committed request.
+    """
+    transaction.on_commit(lambda: task.delay(*args), robust=True)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from backend import expiry
+
+
+class Command(BaseCommand):
+    help = 'Cancel orders left awaiting payment past PENDING_ORDER_TIMEOUT and restore their stock. Meant to be run periodically, e.g. from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Orders cancelled per transaction (default: ORDER_EXPIRY_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        report = expiry.expire_pending_orders(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,22 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from backend import product_io
+
+
+class Command(BaseCommand):
+    help = 'Write every product as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=product_io.FORMATS, default='csv')
+        parser.add_argument('--output', help='Defaults to standard output.')
+
+    def handle(self, *args, **options):
+        stream = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in product_io.export_products(options['format']):
+                stream.write(chunk)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from backend import images, models
+
+
+class Command(BaseCommand):
+    help = 'Render the resized WebP copies of product images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Only images that have no derivatives yet.')
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            count = images.generate_missing_derivatives()
+        else:
+            image_ids = models.ProductImage.objects.order_by('pk').values_list('pk', flat=True)
+            count = sum(images.generate_derivatives(image_id) for image_id in image_ids.iterator())
+        self.stdout.write(self.style.SUCCESS(f"Rendered derivatives for {count} image(s)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import product_io
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSON Lines file, matching on sku.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=product_io.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or product_io.format_for(options['path'])
+        try:
+            stream = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(error)
+
+        def progress(report):
+            self.stdout.write(f"{report.rows} rows read, {report.created} created, {report.updated} updated")
+
+        with stream:
+            report = product_io.import_products(
+                product_io.read_rows(stream, file_format), batch_size=options['batch_size'], progress=progress
+            )
+        for error in report.errors:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(str(report)))
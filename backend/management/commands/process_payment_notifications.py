@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend import payment_notifications
+
+
+class Command(BaseCommand):
+    help = 'Apply stored Midtrans payment notifications that no drain has processed yet. Meant to be run periodically, e.g. from cron.'
+
+    def handle(self, *args, **options):
+        count = payment_notifications.drain()
+        self.stdout.write(self.style.SUCCESS(f"Applied {count} payment notification(s)."))
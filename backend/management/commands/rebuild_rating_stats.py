@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from backend import models
+
+STAT_FIELDS = ['count', 'total', 'star_1', 'star_2', 'star_3', 'star_4', 'star_5']
+
+
+def compute_rating_stats():
+    stats = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    rows = models.Review.objects.filter(order_item__isnull=False).values(
+        'order_item__product_id', 'rating'
+    ).annotate(n=Count('id'))
+    for row in rows:
+        product_stats = stats[row['order_item__product_id']]
+        product_stats['count'] += row['n']
+        product_stats['total'] += row['n'] * row['rating']
+        product_stats[f"star_{row['rating']}"] += row['n']
+    return stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-product rating statistics from the reviews table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift, do not rewrite the table.')
+
+    def handle(self, *args, **options):
+        expected = compute_rating_stats()
+
+        if options['check']:
+            stored = {
+                row.pop('product_id'): row
+                for row in models.ProductRatingStats.objects.values('product_id', *STAT_FIELDS)
+            }
+            empty = dict.fromkeys(STAT_FIELDS, 0)
+            drifted = [
+                product_id for product_id in set(expected) | set(stored)
+                if expected.get(product_id, empty) != stored.get(product_id, empty)
+            ]
+            if drifted:
+                raise CommandError(f"Rating stats drifted for {len(drifted)} product(s): {sorted(drifted)}")
+            self.stdout.write(self.style.SUCCESS('Rating stats are consistent with the reviews.'))
+            return
+
+        with transaction.atomic():
+            models.ProductRatingStats.objects.all().delete()
+            models.ProductRatingStats.objects.bulk_create(
+                [models.ProductRatingStats(product_id=product_id, **values) for product_id, values in expected.items()],
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating stats for {len(expected)} product(s)."))
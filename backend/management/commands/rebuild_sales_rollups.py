@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend import sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily product and category sales rollups from the paid orders.'
+
+    def handle(self, *args, **options):
+        count = sales.rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily product sales row(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = search.rebuild_index(batch_size=options['batch_size'])
+        backend = 'FTS5' if search.uses_fts() else 'token'
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} product(s) in the {backend} index."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete stock reservations whose carts were abandoned. Meant to be run periodically, e.g. from cron.'
+
+    def handle(self, *args, **options):
+        count = reservations.release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Released {count} expired stock reservation(s)."))
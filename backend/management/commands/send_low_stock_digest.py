@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend import notifications
+
+
+class Command(BaseCommand):
+    help = 'Email staff one digest of all pending low-stock alerts. Meant to be run periodically, e.g. from cron.'
+
+    def handle(self, *args, **options):
+        count = notifications.send_low_stock_digest()
+        self.stdout.write(self.style.SUCCESS(f"Sent low stock digest for {count} product(s)."))
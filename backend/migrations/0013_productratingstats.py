@@ -0,0 +1,45 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Review = apps.get_model('backend', 'Review')
+    ProductRatingStats = apps.get_model('backend', 'ProductRatingStats')
+
+    stats = {}
+    rows = Review.objects.filter(order_item__isnull=False).values('order_item__product_id', 'rating').annotate(
+        n=models.Count('id')
+    )
+    for row in rows:
+        product_stats = stats.setdefault(row['order_item__product_id'], ProductRatingStats(product_id=row['order_item__product_id']))
+        product_stats.count += row['n']
+        product_stats.total += row['n'] * row['rating']
+        star = f"star_{row['rating']}"
+        setattr(product_stats, star, getattr(product_stats, star) + row['n'])
+    ProductRatingStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_product_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRatingStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='backend.product')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('star_1', models.PositiveIntegerField(default=0)),
+                ('star_2', models.PositiveIntegerField(default=0)),
+                ('star_3', models.PositiveIntegerField(default=0)),
+                ('star_4', models.PositiveIntegerField(default=0)),
+                ('star_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:31
+
+from django.db import migrations, models
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+
+    totals = OrderItem.objects.values('order_id').annotate(
+        total_price=models.Sum(models.F('quantity') * models.F('unit_price')),
+        item_count=models.Sum('quantity'),
+    )
+    orders = [Order(pk=row['order_id'], total_price=row['total_price'], item_count=row['item_count']) for row in totals]
+    Order.objects.bulk_update(orders, ['total_price', 'item_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_productratingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:32
+
+import datetime
+import re
+
+from django.db import migrations, models
+
+
+def seed_order_number_sequences(apps, schema_editor):
+    Order = apps.get_model('backend', 'Order')
+    OrderNumberSequence = apps.get_model('backend', 'OrderNumberSequence')
+
+    last_values = {}
+    for order_number in Order.objects.exclude(order_number=None).values_list('order_number', flat=True).iterator():
+        match = re.fullmatch(r'ORD(\d{8})-(\d+)', order_number, flags=re.IGNORECASE)
+        if match:
+            day = datetime.datetime.strptime(match.group(1), '%Y%m%d').date()
+            last_values[day] = max(last_values.get(day, 0), int(match.group(2)))
+    OrderNumberSequence.objects.bulk_create(
+        [OrderNumberSequence(day=day, last_value=value) for day, value in last_values.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_order_number_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:34
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.utils import OperationalError
+
+FIELD_WEIGHTS = {'title': 3, 'description': 1, 'sku': 3, 'category': 2}
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE backend_product_fts USING fts5(title, description, sku, category)"
+            )
+        except OperationalError:
+            # SQLite built without FTS5, the token index is used instead.
+            pass
+        else:
+            schema_editor.execute(
+                "INSERT INTO backend_product_fts (rowid, title, description, sku, category) "
+                "SELECT p.id, p.title, COALESCE(p.description, ''), COALESCE(p.sku, ''), c.name "
+                "FROM backend_product p INNER JOIN backend_category c ON c.id = p.category_id"
+            )
+            return
+
+    Product = apps.get_model('backend', 'Product')
+    ProductSearchToken = apps.get_model('backend', 'ProductSearchToken')
+    tokens = []
+    for product in Product.objects.select_related('category').iterator():
+        weights = {}
+        document = {
+            'title': product.title,
+            'description': product.description,
+            'sku': product.sku,
+            'category': product.category.name,
+        }
+        for field, text in document.items():
+            for token in re.findall(r'\w+', (text or '').lower()):
+                weights[token[:64]] = weights.get(token[:64], 0) + FIELD_WEIGHTS[field]
+        tokens.extend(ProductSearchToken(product=product, token=token, weight=weight) for token, weight in weights.items())
+    ProductSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS backend_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_lowstockevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='backend.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'product'], name='search_token_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsearchtoken',
+            constraint=models.UniqueConstraint(fields=('product', 'token'), name='unique_token_per_product'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
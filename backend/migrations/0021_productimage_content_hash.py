@@ -0,0 +1,36 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:44
+
+import backend.storage
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    ProductImage = apps.get_model('backend', 'ProductImage')
+    for product_image in ProductImage.objects.exclude(image='').iterator():
+        try:
+            with product_image.image.open('rb') as file:
+                product_image.content_hash = backend.storage.content_hash(file)
+        except FileNotFoundError:
+            continue
+        product_image.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=backend.storage.ContentAddressedStorage(), upload_to='store/images/'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
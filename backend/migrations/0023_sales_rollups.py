@@ -0,0 +1,77 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncDate
+
+PAID_STATUSES = ['b', 'c', 'd']
+
+
+def backfill_sales(apps, schema_editor):
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    DailyProductSales = apps.get_model('backend', 'DailyProductSales')
+    DailyCategorySales = apps.get_model('backend', 'DailyCategorySales')
+
+    # The payment time was never stored; the last save is the closest record of it.
+    Order.objects.filter(status__in=PAID_STATUSES).update(paid_at=models.F('order_time'))
+
+    paid_items = OrderItem.objects.filter(order__status__in=PAID_STATUSES).annotate(day=TruncDate('order__paid_at'))
+    for model, key in [(DailyProductSales, 'product'), (DailyCategorySales, 'product__category')]:
+        rows = paid_items.values('day', key).annotate(
+            total_units=models.Sum('quantity'),
+            total_revenue=models.Sum(models.F('quantity') * models.F('unit_price')),
+            order_count=models.Count('order', distinct=True),
+        ).order_by()
+        field = key.rsplit('__', 1)[-1] + '_id'
+        model.objects.bulk_create([
+            model(day=row['day'], units=row['total_units'], revenue=row['total_revenue'],
+                  orders=row['order_count'], **{field: row[key]})
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_product_sku_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='backend.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='backend.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('day', 'product'), name='unique_product_sales_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='unique_category_sales_day'),
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
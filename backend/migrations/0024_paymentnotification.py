@@ -0,0 +1,31 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('order_number', models.CharField(max_length=50)),
+                ('transaction_status', models.CharField(max_length=32)),
+                ('fraud_status', models.CharField(blank=True, max_length=32)),
+                ('gross_amount', models.CharField(max_length=32)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, max_length=64)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='notification_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0024_paymentnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='pending_quantity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 00:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PAID_STATUSES = ['b', 'c', 'd']
+
+
+def backfill_item_categories(apps, schema_editor):
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    Product = apps.get_model('backend', 'Product')
+
+    # The category at payment time was never stored; the rollups so far were
+    # credited to the product's current one, so record that.
+    OrderItem.objects.filter(order__status__in=PAID_STATUSES, order__paid_at__isnull=False).update(
+        category=models.Subquery(Product.objects.filter(pk=models.OuterRef('product_id')).values('category_id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0025_cartitem_pending_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.category'),
+        ),
+        migrations.RunPython(backfill_item_categories, migrations.RunPython.noop),
+    ]
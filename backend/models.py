@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.core.validators import MinValueValidator
+from django.db.models import F, Prefetch, Sum
 from django.core.cache import cache
 from django.utils.text import slugify
 from django_fsm import FSMField, transition
@@ -9,6 +10,8 @@ from django.utils import timezone
 
 
 import uuid
+
+from . import storage
 # Create your models here.
 
 class UserManager(BaseUserManager):
@@ -69,6 +72,11 @@ class Customer(models.Model):
     
 
 class Category(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='category_name_idx'),
+        ]
+
     name = models.CharField(max_length=255)
     
 
@@ -76,11 +84,35 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_reviews(self):
+        # Ratings come from the denormalized stats row and the reviews themselves are
+        # fetched in bulk, so serializing a page costs a fixed number of queries.
+        reviewed_items = OrderItem.objects.filter(review__isnull=False).distinct().prefetch_related('review_set')
+        return self.select_related('category', 'rating_stats').prefetch_related(
+            'images',
+            Prefetch('orderitem_set', queryset=reviewed_items, to_attr='reviewed_items'),
+        )
+
+
 class Product(models.Model):
+    class Meta:
+        # One index per ordering offered by ProductViewSet, with and without the
+        # category filter; each ends in id to match the keyset pagination order.
+        indexes = [
+            models.Index(fields=['create_at', 'id'], name='product_recent_idx'),
+            models.Index(fields=['unit_price', 'id'], name='product_price_idx'),
+            models.Index(fields=['category', 'create_at', 'id'], name='product_category_recent_idx'),
+            models.Index(fields=['category', 'unit_price', 'id'], name='product_category_price_idx'),
+            # Bulk imports match existing products on sku.
+            models.Index(fields=['sku'], name='product_sku_idx'),
+        ]
+
     title = models.CharField(max_length=255)
     sku = models.CharField(max_length=255,null=True)
     slug = models.SlugField()
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, default=1)
+    # Covered by the composite category indexes below.
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, default=1, db_index=False)
     description = models.TextField(null=True, blank=True)
     unit_price = models.PositiveIntegerField(blank=True, default=0)
     inventory = models.PositiveIntegerField(blank=True, default=0)
@@ -88,6 +120,8 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     create_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.title
     
@@ -100,42 +134,101 @@ class Product(models.Model):
 
     @property
     def image(self):
-        images = self.images.all()
-        if images.count() == 0:
-            return None
-        return images.first()
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            images = self.images.all()
+            return images[0] if images else None
+        return self.images.order_by('pk').first()
 
     @property
-    def average_rating(self):
-        reviews = Review.objects.filter(order_item__product=self)
-
-        if len(reviews) == 0:
-            return None
+    def stats(self):
+        try:
+            return self.rating_stats
+        except ProductRatingStats.DoesNotExist:
+            return ProductRatingStats(product=self)
 
-        total = 0
-        for review in reviews:
-            total += review.rating
-
-        return total / len(reviews)
+    @property
+    def average_rating(self):
+        return self.stats.average
 
     @property
     def reviews(self):
+        if hasattr(self, 'reviewed_items'):
+            return [review for item in self.reviewed_items for review in item.review_set.all()]
         return Review.objects.filter(order_item__product=self)
 
     @property
     def few_reviews(self):
-        qs = self.reviews
-        if qs.count() > 10:
-            return qs[:10]
-        return qs
+        return self.reviews[:10]
 
     @property
     def review_count(self):
-        return self.reviews.count()
+        return self.stats.count
     
+
+class ProductRatingStats(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='rating_stats')
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+
+    @property
+    def average(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    @property
+    def histogram(self):
+        return {rating: getattr(self, f'star_{rating}') for rating in range(1, 6)}
+
+    @classmethod
+    def apply(cls, product_id, rating, delta):
+        """Add (or with a negative delta, remove) ``delta`` ratings of ``rating`` stars."""
+        star = f'star_{rating}'
+        with transaction.atomic():
+            cls.objects.get_or_create(product_id=product_id)
+            cls.objects.filter(product_id=product_id).update(
+                count=F('count') + delta,
+                total=F('total') + delta * rating,
+                **{star: F(star) + delta},
+            )
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='store/images/')
+    image = models.ImageField(upload_to='store/images/', storage=storage.product_images)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.content_hash = storage.content_hash(self.image.file)
+        super().save(*args, **kwargs)
+
+
+class ProductSearchToken(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'token'], name='unique_token_per_product')
+        ]
+        indexes = [
+            models.Index(fields=['token', 'product'], name='search_token_idx')
+        ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField()
+
+
+class LowStockEvent(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_events')
+    inventory = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
 
 
 class FeaturedProduct(models.Model):
@@ -155,13 +248,44 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # A quantity change accepted from the cache-backed cart but not yet written behind.
+    pending_quantity = models.PositiveIntegerField(null=True, blank=True)
 
     @property
     def total_price(self):
         return self.quantity * self.product.unit_price
 
 
+class OrderNumberSequence(models.Model):
+    day = models.DateField(primary_key=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+
+class StockReservation(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_reservation_in_cart')
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+
 class Order(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'id'], name='order_customer_idx'),
+            models.Index(fields=['status', 'id'], name='order_status_idx'),
+            models.Index(fields=['status', 'order_time'], name='order_status_time_idx'),
+            models.Index(fields=['order_time'], name='order_time_idx'),
+        ]
+
     STATUS_AWAITING_PAYMENT = 'a'
     STATUS_PROCESSED = 'b'
     STATUS_SHIPPED = 'c'
@@ -179,34 +303,24 @@ class Order(models.Model):
     order_time = models.DateTimeField(auto_now=True)
     status = FSMField(max_length=1, choices=STATUS_CHOICES, default=STATUS_AWAITING_PAYMENT)
     shipping_reference = models.CharField(max_length=50, blank=True, null=True)
-    
+    # Filled in at checkout and kept in sync with the items, see `refresh_totals`.
+    total_price = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    paid_at = models.DateTimeField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Get the current date in the format YYYYMMDD
-            date_str = timezone.now().strftime('%Y%m%d')
-
-            # Find the latest order number in the database
-            last_order = Order.objects.filter(order_number__startswith=f"ord{date_str}-").order_by('-order_number').first()
-
-            # Increment the last order number or start from 1 if no orders exist
-            if last_order:
-                last_order_number = int(last_order.order_number[-3:])
-                new_order_number = str(last_order_number + 1).zfill(3)
-            else:
-                new_order_number = "001"
-
-            self.order_number = f"ORD{date_str}-{new_order_number}"
+            from .sequences import order_numbers
+            self.order_number = order_numbers.next_order_number()
         super(Order, self).save(*args, **kwargs)
 
 
-    @property
-    def total_price(self):
-        items = OrderItem.objects.filter(order=self)
-        total = 0
-        for item in items:
-            total += item.total_price
-        return total
+    def refresh_totals(self):
+        totals = self.items.aggregate(total_price=Sum(F('quantity') * F('unit_price')), item_count=Sum('quantity'))
+        self.total_price = totals['total_price'] or 0
+        self.item_count = totals['item_count'] or 0
+        # Update the columns directly so `order_time` is not touched.
+        Order.objects.filter(pk=self.pk).update(total_price=self.total_price, item_count=self.item_count)
 
     @property
     def is_pending(self):
@@ -214,8 +328,12 @@ class Order(models.Model):
 
     @transition(field=status, source=STATUS_AWAITING_PAYMENT, target=STATUS_PROCESSED)
     def complete_payment(self):
+        from . import sales
         self.status = self.STATUS_PROCESSED
-        self.save()
+        self.paid_at = timezone.now()
+        with transaction.atomic():
+            self.save()
+            sales.record_order(self)
 
     @transition(field=status, source=STATUS_PROCESSED, target=STATUS_SHIPPED)
     def ship(self, shipping_reference=''):
@@ -230,10 +348,61 @@ class Order(models.Model):
 
     @transition(field=status, source=[STATUS_AWAITING_PAYMENT, STATUS_PROCESSED], target=STATUS_CANCELLED)
     def cancel(self):
+        from . import sales
+        was_paid = self.status == self.STATUS_PROCESSED
         self.status = self.STATUS_CANCELLED
-        self.save()
+        with transaction.atomic():
+            self.save()
+            if was_paid:
+                sales.record_order(self, reverse=True)
+
+
+
+
+class PaymentNotification(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='notification_pending_idx'),
+        ]
 
+    # One row per distinct notification; Midtrans retries reuse the same key.
+    key = models.CharField(max_length=255, unique=True)
+    order_number = models.CharField(max_length=50)
+    transaction_status = models.CharField(max_length=32)
+    fraud_status = models.CharField(max_length=32, blank=True)
+    gross_amount = models.CharField(max_length=32)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=64, blank=True)
+
+
+# Paid sales per day, kept up to date by `sales.record_order` and rebuilt by the
+# rebuild_sales_rollups command.
+class DailyProductSales(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_product_sales_day')
+        ]
+
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+
+class DailyCategorySales(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_category_sales_day')
+        ]
 
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    orders = models.IntegerField(default=0)
 
 
 class OrderItem(models.Model):
@@ -246,6 +415,8 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     unit_price = models.IntegerField(validators=[MinValueValidator(1)])
+    # The product's category when the order was paid, which the sale is credited to.
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
     @property
     def total_price(self):
@@ -253,7 +424,10 @@ class OrderItem(models.Model):
 
     @property
     def review(self):
-        return self.review_set.first()
+        if 'review_set' in getattr(self, '_prefetched_objects_cache', {}):
+            reviews = self.review_set.all()
+            return reviews[0] if reviews else None
+        return self.review_set.order_by('pk').first()
 
 
 class Review(models.Model):
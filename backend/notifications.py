@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import models
+
+
+def record_low_stock(products):
+    """Queue low-stock alerts for products whose inventory just dropped below their limit."""
+    models.LowStockEvent.objects.bulk_create(
+        [models.LowStockEvent(product=product, inventory=product.inventory) for product in products]
+    )
+
+
+def send_low_stock_digest():
+    """
+    Send all pending low-stock alerts to staff as a single digest.
+
+    Alerts are collapsed per product and the digest reports the current stock.
+    Every staff member gets their own copy, all over one SMTP connection.
+    Pending alerts are claimed in a short transaction and the mail is sent
+    after it commits, so no locks are held while talking to the mail server.
+    If sending fails the claim is released for the next run. Returns the
+    number of products in the digest.
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        events = list(
+            models.LowStockEvent.objects.select_for_update()
+            .filter(notified_at=None)
+            .order_by('id')
+            .values_list('pk', 'product_id')
+        )
+        if not events:
+            return 0
+        event_ids = [pk for pk, _ in events]
+        models.LowStockEvent.objects.filter(pk__in=event_ids).update(notified_at=claimed_at)
+
+    try:
+        products = models.Product.objects.filter(pk__in={product_id for _, product_id in events}).order_by('pk')
+        recipient_emails = list(get_user_model().objects.filter(is_staff=True).values_list('email', flat=True))
+        if recipient_emails:
+            subject = f"Stok menipis: {len(products)} produk"
+            message = "\n".join(
+                f"Jumlah Stok dari {product.title} sudah melewati limit. Jumlah stok yang ada sekarang: {product.inventory}"
+                for product in products
+            )
+            with get_connection() as connection:
+                connection.send_messages([
+                    EmailMessage(subject, message, settings.EMAIL_HOST_USER, [email], connection=connection)
+                    for email in recipient_emails
+                ])
+    except Exception:
+        models.LowStockEvent.objects.filter(pk__in=event_ids, notified_at=claimed_at).update(notified_at=None)
+        raise
+    return len(products)
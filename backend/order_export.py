@@ -0,0 +1,101 @@
+"""
+Streaming export of orders with their line items as CSV or JSON Lines.
+
+Orders are read in primary key order one chunk at a time: one query for the
+chunk's orders joined with their customers and one for all of their items
+joined with products. Memory stays bounded by the chunk size however many
+orders are exported.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+
+from . import models
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+ORDER_FIELDS = {
+    'order_number': 'order_number',
+    'order_time': 'order_time',
+    'status': 'status',
+    'customer_email': 'customer__user__email',
+    'customer_name': None,
+    'customer_phone': 'customer__phone',
+    'shipping_reference': 'shipping_reference',
+    'item_count': 'item_count',
+    'total_price': 'total_price',
+}
+ITEM_FIELDS = ['sku', 'title', 'quantity', 'unit_price', 'total_price']
+CSV_HEADER = list(ORDER_FIELDS) + [f'item_{name}' for name in ITEM_FIELDS]
+
+STATUS_NAMES = dict(models.Order.STATUS_CHOICES)
+
+
+def _chunks(queryset, chunk_size):
+    columns = ['pk', 'customer__user__first_name', 'customer__user__last_name'] + [
+        column for column in ORDER_FIELDS.values() if column
+    ]
+    last_id = 0
+    while True:
+        orders = list(queryset.filter(pk__gt=last_id).order_by('pk').values(*columns)[:chunk_size])
+        if not orders:
+            return
+        last_id = orders[-1]['pk']
+
+        items = {}
+        rows = (
+            models.OrderItem.objects.filter(order_id__in=[order['pk'] for order in orders])
+            .order_by('order_id', 'pk')
+            .values_list('order_id', 'product__sku', 'product__title', 'quantity', 'unit_price')
+        )
+        for order_id, sku, title, quantity, unit_price in rows:
+            items.setdefault(order_id, []).append({
+                'sku': sku, 'title': title, 'quantity': quantity,
+                'unit_price': unit_price, 'total_price': quantity * unit_price,
+            })
+        yield orders, items
+
+
+def _order_record(order):
+    record = {}
+    for name, column in ORDER_FIELDS.items():
+        if name == 'customer_name':
+            record[name] = f"{order['customer__user__first_name']} {order['customer__user__last_name']}".strip()
+        elif name == 'order_time':
+            record[name] = order[column].isoformat()
+        elif name == 'status':
+            record[name] = STATUS_NAMES.get(order[column], order[column])
+        else:
+            record[name] = order[column]
+    return record
+
+
+def export_orders(queryset, file_format, chunk_size=None):
+    """
+    Yield the orders of ``queryset`` as text chunks.
+
+    CSV has one row per line item with the order columns repeated; JSON Lines
+    has one object per order with its items nested.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(CSV_HEADER)
+
+    for orders, items in _chunks(queryset, chunk_size or settings.ORDER_EXPORT_CHUNK_SIZE):
+        for order in orders:
+            record = _order_record(order)
+            order_items = items.get(order['pk'], [])
+            if file_format == 'csv':
+                for item in order_items or [dict.fromkeys(ITEM_FIELDS, '')]:
+                    writer.writerow([*record.values(), *(item[name] for name in ITEM_FIELDS)])
+            else:
+                record['items'] = order_items
+                buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -1,4 +1,12 @@
-from rest_framework.pagination import PageNumberPagination as BasePageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination as BasePageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageNumberPagination(BasePageNumberPagination):
@@ -8,3 +16,92 @@ class PageNumberPagination(BasePageNumberPagination):
         response = super().get_paginated_response(data)
         response.data['total_pages'] = self.page.paginator.num_pages
         return response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the queryset's ``order_by`` fields.
+
+    The ordering has to end in a unique field (``id``) for the cursor to be
+    stable. Each page is a single indexed range query however deep it is, and
+    the total is only counted when the client asks for it with ``count=true``.
+    """
+    page_size = 20
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        results = list(self.page_queryset(queryset, request))
+        self.page = results[:self.page_size]
+        self.next_position = None
+        if len(results) > self.page_size:
+            last = self.page[-1]
+            self.next_position = [
+                queryset.model._meta.get_field(field).value_to_string(last) for field, _ in self.ordering
+            ]
+        return self.page
+
+    def page_queryset(self, queryset, request):
+        """The query for the page at the request's cursor, with one extra row to tell if there is a next page."""
+        self.ordering = [(key.lstrip('-'), key.startswith('-')) for key in queryset.query.order_by]
+        position = self.decode_cursor(queryset.model, request.query_params.get(self.cursor_query_param))
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        return queryset[:self.page_size + 1]
+
+    def after(self, position):
+        # (a, b) > (x, y) expands to a > x OR (a = x AND b > y), per sort direction.
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        # The OR alone makes SQLite combine two index lookups and sort what is
+        # left of the table. A plain range on the first field, redundant as it
+        # is, lets it seek into the ordering's index and read the page in order.
+        field, descending = self.ordering[0]
+        return Q(**{f"{field}__{'lte' if descending else 'gte'}": position[0]}) & condition
+
+    def decode_cursor(self, model, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            return [model._meta.get_field(field).to_python(value) for (field, _), value in zip(self.ordering, values)]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        cursor = base64.urlsafe_b64encode(json.dumps(self.next_position).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response_data = OrderedDict([('next', self.get_next_link())])
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['results'] = data
+        return Response(response_data)
+
+
+class KeysetPaginationMixin:
+    """Switch a viewset to `KeysetPagination` when the client sends a ``cursor`` parameter."""
+
+    def use_keyset_pagination(self):
+        return KeysetPagination.cursor_query_param in self.request.query_params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_keyset_pagination():
+            self._paginator = KeysetPagination()
+        return super().paginator
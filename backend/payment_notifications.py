@@ -0,0 +1,135 @@
+"""
+Midtrans payment notifications.
+
+The webhook only verifies and stores each notification, ignoring Midtrans'
+retries of one it already has, and queues a drain. A drain applies whatever is
+pending in batches: one locking query for the batch's orders, the orders' own
+FSM transitions, and one update per outcome marking the notifications done,
+all in one transaction. A burst of callbacks is coalesced into a few drains,
+and the periodic task picks up anything a lost job left behind.
+"""
+import hashlib
+import hmac
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django_fsm import can_proceed
+
+from . import inventory, jobs, models
+
+PAID_STATUSES = {'capture', 'settlement'}
+FAILED_STATUSES = {'deny', 'cancel', 'expire'}
+ACCEPTED_FRAUD_STATUSES = {'', 'accept'}
+DRAIN_KEY = 'payments:drain'
+REQUIRED_FIELDS = ('order_id', 'status_code', 'gross_amount', 'transaction_status', 'signature_key')
+
+
+def signature(order_id, status_code, gross_amount):
+    raw = f"{order_id}{status_code}{gross_amount}{settings.MIDTRANS_SERVER_KEY}"
+    return hashlib.sha512(raw.encode()).hexdigest()
+
+
+def verify(payload):
+    """Check the notification's ``signature_key`` against our server key."""
+    expected = signature(payload['order_id'], payload['status_code'], payload['gross_amount'])
+    return hmac.compare_digest(expected, str(payload['signature_key']))
+
+
+def record(payload):
+    """Store a verified notification and queue a drain. Returns False for a repeat."""
+    key = ':'.join(str(payload.get(name) or '') for name in ('transaction_id', 'order_id', 'transaction_status', 'status_code'))
+    _, created = models.PaymentNotification.objects.get_or_create(
+        key=key,
+        defaults={
+            'order_number': payload['order_id'],
+            'transaction_status': payload['transaction_status'],
+            'fraud_status': payload.get('fraud_status') or '',
+            'gross_amount': payload['gross_amount'],
+            'payload': payload,
+        },
+    )
+    if created and cache.add(DRAIN_KEY, 1, settings.PAYMENT_DRAIN_RETRY_AFTER):
+        jobs.submit(drain)
+    return created
+
+
+def _amount_matches(order, gross_amount):
+    try:
+        return Decimal(gross_amount) == order.total_price
+    except InvalidOperation:
+        return False
+
+
+def _apply(order, notification):
+    if order is None:
+        return 'unknown order'
+    status = notification.transaction_status
+    if status in PAID_STATUSES and notification.fraud_status in ACCEPTED_FRAUD_STATUSES:
+        if not _amount_matches(order, notification.gross_amount):
+            return 'amount mismatch'
+        if can_proceed(order.complete_payment):
+            order.complete_payment()
+            return 'paid'
+    elif status in FAILED_STATUSES and order.is_pending:
+        order.cancel()
+        return 'cancelled'
+    return f'ignored in status {order.status}'
+
+
+def _drain_batch(batch_size):
+    with transaction.atomic():
+        notifications = list(
+            models.PaymentNotification.objects
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .filter(processed_at=None)
+            .order_by('id')[:batch_size]
+        )
+        if not notifications:
+            return 0
+        orders = {
+            order.order_number: order
+            for order in models.Order.objects.select_for_update().filter(
+                order_number__in={notification.order_number for notification in notifications}
+            )
+        }
+
+        outcomes = {}
+        cancelled = []
+        # In arrival order, so a repeat for an order already moved on is a no-op.
+        for notification in notifications:
+            order = orders.get(notification.order_number)
+            outcome = _apply(order, notification)
+            if outcome == 'cancelled':
+                cancelled.append(order.pk)
+            outcomes.setdefault(outcome, []).append(notification.pk)
+
+        if cancelled:
+            # Unpaid orders still hold their stock, as in `expiry`.
+            inventory.restore_stock(dict(
+                models.OrderItem.objects.filter(order_id__in=cancelled)
+                .values('product_id')
+                .annotate(quantity=Sum('quantity'))
+                .values_list('product_id', 'quantity')
+            ))
+
+        now = timezone.now()
+        for outcome, ids in outcomes.items():
+            models.PaymentNotification.objects.filter(pk__in=ids).update(processed_at=now, outcome=outcome)
+    return len(notifications)
+
+
+def drain(batch_size=None):
+    """Apply every pending notification to its order. Returns the number processed."""
+    # Cleared first so notifications arriving meanwhile queue another drain.
+    cache.delete(DRAIN_KEY)
+    batch_size = batch_size or settings.PAYMENT_NOTIFICATION_BATCH_SIZE
+    total = 0
+    while True:
+        processed = _drain_batch(batch_size)
+        if not processed:
+            return total
+        total += processed
@@ -0,0 +1,103 @@
+"""
+Client for the Midtrans Snap API.
+
+One ``requests`` session per process keeps TLS connections to Midtrans open
+across requests. Every call is bounded by ``MIDTRANS_TIMEOUT``, and failed
+connections or 502/503/504 answers are retried with backoff. A read timeout is
+never retried, since Midtrans may already have created the transaction.
+``create_transaction_async`` runs the same call off the event loop for async
+views.
+"""
+import threading
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import exceptions
+
+SANDBOX_URL = 'https://app.sandbox.midtrans.com/snap/v1'
+PRODUCTION_URL = 'https://app.midtrans.com/snap/v1'
+
+
+class SnapClient:
+    def __init__(self, server_key, base_url, timeout, retries, pool_size):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (server_key, '')
+        self.session.headers.update({'Accept': 'application/json', 'Content-Type': 'application/json'})
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=retries,
+            status_forcelist=(502, 503, 504), allowed_methods=None,
+            backoff_factor=0.2, raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def create_transaction(self, params):
+        """Create a Snap transaction and return Midtrans' response, with ``token`` and ``redirect_url``."""
+        try:
+            response = self.session.post(f'{self.base_url}/transactions', json=params, timeout=self.timeout)
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            raise exceptions.PaymentGatewayError()
+        if response.status_code >= 400:
+            raise exceptions.PaymentGatewayError(data.get('error_messages') if isinstance(data, dict) else None)
+        return data
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SnapClient(
+                    server_key=settings.MIDTRANS_SERVER_KEY,
+                    base_url=settings.MIDTRANS_SNAP_URL or (PRODUCTION_URL if settings.MIDTRANS_IS_PRODUCTION else SANDBOX_URL),
+                    timeout=settings.MIDTRANS_TIMEOUT,
+                    retries=settings.MIDTRANS_RETRIES,
+                    pool_size=settings.MIDTRANS_POOL_SIZE,
+                )
+    return _client
+
+
+def reset_client():
+    """Drop the shared client so the next call picks up changed settings."""
+    global _client
+    _client = None
+
+
+def snap_params(order_number, gross_amount, user, phone):
+    return {
+        "transaction_details": {
+            "order_id": order_number,
+            "gross_amount": gross_amount,
+        },
+        "credit_card": {
+            "secure": True,
+        },
+        "customer_details": {
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "phone": phone,
+        },
+    }
+
+
+def create_transaction(params):
+    return get_client().create_transaction(params)
+
+
+async def create_transaction_async(params):
+    # Not thread sensitive: the call touches no database state, so it may run
+    # in any worker thread rather than queueing behind other sync code.
+    return await sync_to_async(create_transaction, thread_sensitive=False)(params)
@@ -0,0 +1,226 @@
+"""
+Bulk product import and export as CSV or JSON Lines.
+
+Imports upsert by ``sku`` in batches, each one transaction of a handful of
+bulk queries whatever the batch size. Exports stream rows straight from a
+server-side iterator, so neither direction holds the whole catalog in memory.
+"""
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import caching, models, search
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ['sku', 'title', 'category', 'description', 'unit_price', 'inventory', 'limit', 'is_active']
+INTEGER_FIELDS = ['unit_price', 'inventory', 'limit']
+# Only the first rejected rows are listed in a report, the rest are just counted.
+MAX_REPORTED_ERRORS = 100
+
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    batches: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'error': str(error)})
+
+    def __str__(self):
+        return (
+            f"Read {self.rows} rows: created {self.created} and updated {self.updated} products "
+            f"in {self.batches} batches, {self.rejected} rows rejected, {self.seconds:.2f}s."
+        )
+
+
+def format_for(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+
+def read_rows(stream, file_format):
+    """Yield one dict per product from a text stream in the given format."""
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def _clean(row):
+    if not isinstance(row, dict):
+        raise ValueError("not a product object")
+    values = {}
+    for name in FIELDS:
+        if name not in row:
+            continue
+        value = row[name]
+        if isinstance(value, str):
+            value = value.strip()
+        if name in INTEGER_FIELDS:
+            value = int(value or 0)
+            if value < 0:
+                raise ValueError(f"{name} must not be negative")
+        elif name == 'is_active':
+            if isinstance(value, str):
+                value = value.lower() not in ('', '0', 'false', 'no')
+            value = bool(value)
+        values[name] = value
+    if not values.get('sku'):
+        raise ValueError("sku is required")
+    if 'title' in values and not values['title']:
+        raise ValueError("title must not be empty")
+    return values
+
+
+class _Categories:
+    """Category ids by name, creating missing categories as they come up."""
+
+    def __init__(self):
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = set(names) - set(self.ids)
+        if not missing:
+            return
+        self._read(missing)
+        new = [models.Category(name=name) for name in missing if name not in self.ids]
+        if new:
+            models.Category.objects.bulk_create(new)
+            # Read back, as not every database returns the ids of bulk inserted rows.
+            self._read({category.name for category in new})
+
+    def _read(self, names):
+        for pk, name in models.Category.objects.filter(name__in=names).order_by('-pk').values_list('pk', 'name'):
+            self.ids[name] = pk
+
+
+def _import_batch(batch, categories, report):
+    cleaned = {}
+    for line, row in batch:
+        try:
+            values = _clean(row)
+        except (TypeError, ValueError) as error:
+            report.reject(line, error)
+            continue
+        # A later row for the same sku wins.
+        cleaned[values['sku']] = (line, values)
+
+    with transaction.atomic():
+        categories.resolve({values['category'] for _, values in cleaned.values() if values.get('category')})
+        existing = {}
+        for product in models.Product.objects.filter(sku__in=cleaned).order_by('-pk'):
+            existing[product.sku] = product
+
+        now = timezone.now()
+        to_create, to_update, update_fields = [], [], set()
+        for sku, (line, values) in cleaned.items():
+            category = values.pop('category', None)
+            if category:
+                values['category_id'] = categories.ids[category]
+            product = existing.get(sku)
+            if product is None:
+                if not values.get('title'):
+                    report.reject(line, "title is required for a new product")
+                    continue
+                product = models.Product(**values)
+                product.slug = slugify(product.title)
+                to_create.append(product)
+            else:
+                for name, value in values.items():
+                    setattr(product, name, value)
+                # bulk_update() skips auto_now, so stamp the change here.
+                product.create_at = now
+                update_fields.update('category' if name == 'category_id' else name for name in values)
+                to_update.append(product)
+
+        models.Product.objects.bulk_create(to_create)
+        if to_update:
+            update_fields = [name for name in update_fields if name != 'sku'] + ['create_at']
+            models.Product.objects.bulk_update(to_update, update_fields)
+
+        # The bulk queries send no signals, so index the batch here. Selected by
+        # sku, since created products only have a pk where the database returns it.
+        search.index_products(
+            models.Product.objects.select_related('category').filter(sku__in=[p.sku for p in to_create + to_update])
+        )
+        transaction.on_commit(caching.bump_catalog_version)
+
+    report.created += len(to_create)
+    report.updated += len(to_update)
+    report.batches += 1
+
+
+def import_products(rows, batch_size=None, progress=None):
+    """
+    Create or update products from an iterable of row dicts, matching on ``sku``.
+
+    Categories are looked up by name and created when missing. Rows that fail
+    validation are skipped and listed in the report's ``errors``. ``progress``
+    is called with the report after every batch.
+    """
+    batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+    report = ImportReport()
+    categories = _Categories()
+    started = time.monotonic()
+    batch = []
+
+    for line, row in enumerate(rows, start=1):
+        report.rows += 1
+        batch.append((line, row))
+        if len(batch) == batch_size:
+            _import_batch(batch, categories, report)
+            batch = []
+            if progress:
+                progress(report)
+    if batch:
+        _import_batch(batch, categories, report)
+        if progress:
+            progress(report)
+
+    report.seconds = time.monotonic() - started
+    return report
+
+
+def export_products(file_format, chunk_size=2000):
+    """Yield the whole catalog as chunks of CSV or JSON Lines text."""
+    rows = (
+        models.Product.objects.order_by('pk')
+        .values_list('sku', 'title', 'category__name', 'description', 'unit_price', 'inventory', 'limit', 'is_active')
+        .iterator(chunk_size=chunk_size)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(FIELDS)
+
+    for count, row in enumerate(rows, start=1):
+        if file_format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,45 @@
+"""
+Time-limited stock holds taken when products are added to a cart.
+
+A product's available stock is its inventory minus the active holds of other
+carts. Checkout turns the cart's holds into a sale; holds of abandoned carts
+simply expire and are swept up by `release_expired`.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import exceptions, models
+
+
+def reserved_quantities(product_ids, exclude_cart_id=None):
+    """Return ``{product_id: quantity}`` held by active reservations, optionally ignoring one cart."""
+    holds = models.StockReservation.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if exclude_cart_id is not None:
+        holds = holds.exclude(cart_id=exclude_cart_id)
+    return dict(holds.values('product_id').annotate(quantity=Sum('quantity')).values_list('product_id', 'quantity'))
+
+
+def hold(cart_id, product_id, quantity):
+    """Reserve ``quantity`` of a product for a cart, replacing the cart's previous hold on it."""
+    with transaction.atomic():
+        # The product row is only locked for this short check-and-write.
+        inventory = models.Product.objects.select_for_update().values_list('inventory', flat=True).get(pk=product_id)
+        held = reserved_quantities([product_id], exclude_cart_id=cart_id).get(product_id, 0)
+        if quantity > inventory - held:
+            raise exceptions.QuantityError()
+        models.StockReservation.objects.update_or_create(
+            cart_id=cart_id,
+            product_id=product_id,
+            defaults={'quantity': quantity, 'expires_at': timezone.now() + settings.STOCK_RESERVATION_TTL},
+        )
+
+
+def release(cart_id, product_ids):
+    models.StockReservation.objects.filter(cart_id=cart_id, product_id__in=product_ids).delete()
+
+
+def release_expired():
+    deleted, _ = models.StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
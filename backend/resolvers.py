@@ -0,0 +1,30 @@
+"""
+Request-scoped lookups of the current customer and cart.
+
+Views and serializers handling the same request share one lookup each instead
+of resolving the customer and cart again wherever they are needed.
+"""
+from rest_framework.generics import get_object_or_404
+
+from . import models
+
+
+def get_customer(request):
+    if not hasattr(request, '_customer'):
+        request._customer = get_object_or_404(models.Customer.objects.select_related('user'), user=request.user)
+    return request._customer
+
+
+def get_cart(request, create=False):
+    """Return the customer's cart, or None if they have none yet unless ``create`` is set."""
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        customer = get_customer(request)
+        if create:
+            cart, _ = models.Cart.objects.get_or_create(customer=customer)
+        else:
+            cart = models.Cart.objects.filter(customer=customer).first()
+        if cart is not None:
+            cart.customer = customer
+        request._cart = cart
+    return cart
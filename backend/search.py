@@ -0,0 +1,136 @@
+"""
+Product search index.
+
+Products are indexed on title, SKU, category name and description. On SQLite
+builds with FTS5 the index is an FTS5 table ranked with bm25; everywhere else
+it is the `ProductSearchToken` inverted index. Either way a search only reads
+the index entries for the query terms instead of scanning the catalog. The
+last query term is matched as a prefix so results update while typing.
+"""
+import re
+
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery, Sum
+
+from . import models
+
+FTS_TABLE = 'backend_product_fts'
+# Field weights, in the column order of the FTS table.
+FIELD_WEIGHTS = {'title': 3, 'description': 1, 'sku': 3, 'category': 2}
+MAX_TOKEN_LENGTH = 64
+
+_use_fts = None
+
+
+def tokenize(text):
+    return [token[:MAX_TOKEN_LENGTH] for token in re.findall(r'\w+', (text or '').lower())]
+
+
+def document(product):
+    return {
+        'title': product.title,
+        'description': product.description or '',
+        'sku': product.sku or '',
+        'category': product.category.name,
+    }
+
+
+def uses_fts():
+    global _use_fts
+    if _use_fts is None:
+        _use_fts = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _use_fts
+
+
+def index_products(products):
+    """(Re)index the given products, replacing whatever was indexed for them before."""
+    products = list(products)
+    if not products:
+        return
+    remove_products([product.pk for product in products])
+
+    if uses_fts():
+        columns = list(FIELD_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(columns)}) VALUES (%s{', %s' * len(columns)})",
+                [[product.pk, *document(product).values()] for product in products],
+            )
+        return
+
+    tokens = []
+    for product in products:
+        weights = {}
+        for field, text in document(product).items():
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0) + FIELD_WEIGHTS[field]
+        tokens.extend(models.ProductSearchToken(product=product, token=token, weight=weight) for token, weight in weights.items())
+    models.ProductSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if uses_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(product_ids))})", product_ids
+            )
+    else:
+        models.ProductSearchToken.objects.filter(product_id__in=product_ids).delete()
+
+
+def clear_index():
+    if uses_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    else:
+        models.ProductSearchToken.objects.all().delete()
+
+
+def rebuild_index(batch_size=1000):
+    clear_index()
+    count = 0
+    batch = []
+    for product in models.Product.objects.select_related('category').order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) == batch_size:
+            index_products(batch)
+            count += len(batch)
+            batch = []
+    index_products(batch)
+    return count + len(batch)
+
+
+def search(queryset, query):
+    """Restrict ``queryset`` to products matching ``query``, best matches first."""
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+
+    if uses_fts():
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        weights = ', '.join(f'{weight:.1f}' for weight in FIELD_WEIGHTS.values())
+        product_table = models.Product._meta.db_table
+        # Joined rather than ranked in a subquery, so the MATCH runs once for
+        # the whole query instead of once per matching product.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE} MATCH %s", f"{FTS_TABLE}.rowid = {product_table}.id"],
+            params=[match],
+            select={'search_rank': f"-bm25({FTS_TABLE}, {weights})"},
+        ).order_by('-search_rank', '-pk')
+
+    *words, prefix = terms
+    conditions = [Q(token=word) for word in words]
+    # A range instead of `startswith` keeps the lookup on the token index everywhere.
+    conditions.append(Q(token__gte=prefix, token__lt=prefix + '\U0010ffff'))
+
+    for condition in conditions:
+        queryset = queryset.filter(pk__in=models.ProductSearchToken.objects.filter(condition).values('product_id'))
+    matching = Q()
+    for condition in conditions:
+        matching |= condition
+    rank = models.ProductSearchToken.objects.filter(matching, product=OuterRef('pk')).values('product').annotate(
+        total=Sum('weight')
+    ).values('total')
+    return queryset.annotate(search_rank=Subquery(rank)).order_by('-search_rank', '-pk')
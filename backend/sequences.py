@@ -0,0 +1,67 @@
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import exceptions, models
+
+# Fixed width of the numeric suffix, so a day's order numbers sort lexically.
+# "ORD" + date + "-" + suffix must fit Order.order_number's 20 characters.
+SUFFIX_WIDTH = 6
+MAX_SUFFIX = 10 ** SUFFIX_WIDTH - 1
+
+
+def reserve_block(day, size):
+    """Atomically reserve ``size`` numbers of the day's sequence, returning ``(first, end)``."""
+    with transaction.atomic():
+        models.OrderNumberSequence.objects.get_or_create(day=day)
+        models.OrderNumberSequence.objects.filter(day=day).update(last_value=F('last_value') + size)
+        end = models.OrderNumberSequence.objects.filter(day=day).values_list('last_value', flat=True).get()
+    return end - size + 1, end + 1
+
+
+class OrderNumberAllocator:
+    """
+    Hands out daily order numbers from blocks reserved in the database.
+
+    Each process reserves ``ORDER_NUMBER_BLOCK_SIZE`` numbers at a time, so the
+    sequence row is only touched (and locked) once per block instead of once per
+    order. Numbers are unique but may have gaps when a process exits mid-block.
+    Inside a transaction a single number is reserved instead, since the block
+    would be lost on rollback.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = self._end = 0
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1)
+
+    def next_value(self, day):
+        if connection.in_atomic_block:
+            # A reservation made inside someone else's transaction can still be
+            # rolled back, so nothing from it may be kept for later orders.
+            first, _ = reserve_block(day, 1)
+            return first
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                self._day = day
+                self._next, self._end = reserve_block(day, self.block_size)
+            value = self._next
+            self._next += 1
+            return value
+
+    def next_order_number(self):
+        day = timezone.localdate()
+        value = self.next_value(day)
+        if value > MAX_SUFFIX:
+            raise exceptions.OrderNumbersExhausted()
+        return f"ORD{day:%Y%m%d}-{value:0{SUFFIX_WIDTH}d}"
+
+
+order_numbers = OrderNumberAllocator()
@@ -1,7 +1,13 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers, exceptions
 from djoser.serializers import UserCreateSerializer, UserSerializer 
 from django.contrib.auth import get_user_model
-from . import models, exceptions
+from . import models, caching, images, reservations, storage
 
 User = get_user_model()
 
@@ -60,9 +66,28 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'product_count']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    sizes = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = models.ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'sizes', 'srcset']
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_sizes(self, product_image):
+        return {size: self._absolute(url) for size, url in images.derivative_urls(product_image).items()}
+
+    def get_srcset(self, product_image):
+        sizes = self.get_sizes(product_image)
+        # A source narrower than the larger sizes renders them at its own
+        # width, and a srcset may name each width only once.
+        urls_by_width = {}
+        for size, entry in product_image.derivatives.items():
+            urls_by_width.setdefault(entry['width'], sizes[size])
+        return ', '.join(f'{url} {width}w' for width, url in sorted(urls_by_width.items()))
 
 
 class SimpleProductSerializer(serializers.ModelSerializer):
@@ -112,6 +137,9 @@ class ProductSerializer(serializers.ModelSerializer):
     slug = serializers.CharField(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    review_count = serializers.IntegerField(read_only=True)
+    reviews = SimpleReviewSerializer(many=True, read_only=True)
 
 
 
@@ -125,59 +153,69 @@ class FeaturedProductSerializer(serializers.ModelSerializer):
 class Base64ImageField(serializers.ImageField):
     """
     A Django REST framework field for handling image-uploads through raw post data.
-    It uses base64 for encoding and decoding the contents of the file.
+    It accepts either a base64 string, optionally as a "data:" URI, or a regular
+    multipart file upload.
 
-    Heavily based on
-    https://github.com/tomchristie/django-rest-framework/pull/1268
-
-    Updated for Django REST framework 3.
+    Base64 is decoded to a temporary file in chunks and the format and size are
+    read from the image header, so a large upload is never held in memory whole.
     """
 
     def to_internal_value(self, data):
-        from django.core.files.base import ContentFile
-        import base64
-        import six
         import uuid
 
         # Check if this is a base64 string
-        if isinstance(data, six.string_types):
+        if isinstance(data, str):
             # Check if the base64 string is in the "data:" format
-            if "data:" in data and ";base64," in data:
+            if data.startswith("data:") and ";base64," in data:
                 # Break out the header from the base64 content
-                header, data = data.split(";base64,")
+                data = data[data.index(";base64,") + len(";base64,"):]
 
             # Try to decode the file. Return validation error if it fails.
             try:
-                decoded_file = base64.b64decode(data)
-            except TypeError:
+                data = images.decode_base64(data)
+            except ValueError:
                 self.fail("invalid_image")
 
-            # Generate file name:
-            file_name = str(uuid.uuid4())[:12]  # 12 characters are more than enough.
-            # Get the file name extension:
-            file_extension = self.get_file_extension(file_name, decoded_file)
-
-            complete_file_name = "%s.%s" % (
-                file_name,
-                file_extension,
-            )
+            # Generate file name: 12 characters are more than enough.
+            file_name = str(uuid.uuid4())[:12]
+        elif hasattr(data, 'read'):
+            file_name = os.path.splitext(data.name or '')[0] or str(uuid.uuid4())[:12]
+        else:
+            self.fail("invalid")
 
-            data = ContentFile(decoded_file, name=complete_file_name)
+        try:
+            data.name = "%s.%s" % (file_name, images.inspect(data))
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
 
         return super(Base64ImageField, self).to_internal_value(data)
 
-    def get_file_extension(self, file_name, decoded_file):
-        import imghdr
 
-        extension = imghdr.what(file_name, decoded_file)
-        extension = "jpg" if extension == "jpeg" else extension
+class ImageListField(serializers.ListField):
+    """A list of uploaded images, decoded and validated in parallel."""
 
-        return extension
+    def run_child_validation(self, data):
+        if len(data) < 2:
+            return super().run_child_validation(data)
+
+        def validate(item):
+            try:
+                return self.child.run_validation(item), None
+            except serializers.ValidationError as e:
+                return None, e.detail
+
+        with ThreadPoolExecutor(max_workers=min(len(data), settings.IMAGE_UPLOAD_WORKERS)) as pool:
+            results = list(pool.map(validate, data))
+
+        errors = {idx: detail for idx, (_, detail) in enumerate(results) if detail is not None}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [value for value, _ in results]
 
 
 class CreateProductSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
-    uploaded_images = serializers.ListField(
+    uploaded_images = ImageListField(
         child=Base64ImageField(allow_empty_file=False, use_url=False),
         write_only=True,
     )
@@ -195,18 +233,14 @@ class CreateProductSerializer(serializers.ModelSerializer):
         product = models.Product.objects.create(**validated_data)
         product.category = category_data  # Use the set() method to set the categories
 
-        for image in uploaded_images:
-            models.ProductImage.objects.create(product=product, image=image)
+        self.add_images(product, self.hash_images(uploaded_images))
 
         return product
     
     def update(self, instance, validated_data):
-        uploaded_images = validated_data.pop("uploaded_images", [])
+        uploaded_images = validated_data.pop("uploaded_images", None)
         category_data = validated_data.pop("category", None)
 
-        # Delete existing images
-        instance.images.all().delete()
-
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
@@ -215,12 +249,37 @@ class CreateProductSerializer(serializers.ModelSerializer):
 
         instance.save()
 
-        # Add new images
-        for image in uploaded_images:
-            models.ProductImage.objects.create(product=instance, image=image)
+        # Images left out of the request are kept; a submitted list replaces
+        # the current one, touching only the images that actually changed.
+        if uploaded_images is not None:
+            submitted = self.hash_images(uploaded_images)
+            existing = set(instance.images.values_list('content_hash', flat=True))
+            instance.images.exclude(content_hash__in=submitted).delete()
+            self.add_images(instance, {digest: image for digest, image in submitted.items() if digest not in existing})
+            getattr(instance, '_prefetched_objects_cache', {}).pop('images', None)
 
         return instance
 
+    def hash_images(self, uploaded_images):
+        # Keyed by content hash, which also drops duplicates within a request.
+        return {storage.content_hash(image): image for image in uploaded_images}
+
+    def add_images(self, product, images_by_hash):
+        models.ProductImage.objects.bulk_create([
+            models.ProductImage(product=product, image=image, content_hash=digest)
+            for digest, image in images_by_hash.items()
+        ])
+        # Read back, as not every database returns the ids of bulk inserted rows.
+        created = models.ProductImage.objects.filter(product=product, content_hash__in=images_by_hash)
+        for image_id in created.values_list('pk', flat=True):
+            images.queue_derivatives(image_id)
+        for image in images_by_hash.values():
+            # Saved uploads were moved into storage, so close them before tempfile tries to delete them.
+            image.close()
+        if images_by_hash:
+            # bulk_create sends no post_save, so cached catalog pages are not invalidated otherwise.
+            caching.invalidate_catalog()
+
 
 class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -243,8 +302,9 @@ class WriteCartItemSerializer(serializers.ModelSerializer):
         return product_id
 
     def update(self, cart_item, validated_data):
-        if validated_data['quantity'] > cart_item.product.inventory:
-            raise exceptions.QuantityError()
+        reservations.hold(cart_item.cart_id, cart_item.product_id, validated_data['quantity'])
+        # A quantity set here replaces any change still waiting to be written behind.
+        cart_item.pending_quantity = None
         return super().update(cart_item, validated_data)
 
     def save(self, **kwargs):
@@ -259,12 +319,12 @@ class WriteCartItemSerializer(serializers.ModelSerializer):
         quantity = self.validated_data['quantity']
         try:
             cart_item = models.CartItem.objects.get(cart=cart, product_id=product_id)
-            cart_item.quantity += quantity
+            cart_item.quantity = (cart_item.pending_quantity or cart_item.quantity) + quantity
+            cart_item.pending_quantity = None
         except models.CartItem.DoesNotExist:
             cart_item = models.CartItem(cart=cart, **self.validated_data)
 
-        if cart_item.quantity > cart_item.product.inventory:
-            raise exceptions.QuantityError()
+        reservations.hold(cart.pk, product_id, cart_item.quantity)
 
         cart_item.save()
         self.instance = cart_item
@@ -273,11 +333,28 @@ class WriteCartItemSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     total_price = serializers.ReadOnlyField()
+    item_count = serializers.ReadOnlyField()
+    paid_at = serializers.ReadOnlyField()
 
     class Meta:
         model = models.Order
-        fields = ['id', 'items', 'customer','order_number','order_time', 'total_price', 'status']
+        fields = ['id', 'items', 'customer','order_number','order_time', 'total_price', 'item_count', 'status', 'paid_at']
 
     items = OrderItemSerializer(many=True)
     customer = CustomerSerializer(read_only=True)
     
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    order_by = serializers.ChoiceField(choices=['revenue', 'units'], default='revenue')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=29))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
@@ -0,0 +1,101 @@
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import authentication, caching, images, models, search
+
+
+def _product_id_for(order_item_id):
+    if order_item_id is None:
+        return None
+    return models.OrderItem.objects.filter(pk=order_item_id).values_list('product_id', flat=True).first()
+
+
+@receiver(pre_save, sender=models.Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk is not None:
+        instance._previous_rating = sender.objects.filter(pk=instance.pk).values_list(
+            'order_item__product_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=models.Review)
+def update_rating_stats_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    current = (_product_id_for(instance.order_item_id), instance.rating)
+    if previous == current:
+        return
+    if previous is not None and previous[0] is not None:
+        models.ProductRatingStats.apply(previous[0], previous[1], -1)
+    if current[0] is not None:
+        models.ProductRatingStats.apply(current[0], current[1], 1)
+
+
+@receiver(post_delete, sender=models.Review)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    product_id = _product_id_for(instance.order_item_id)
+    if product_id is not None:
+        models.ProductRatingStats.apply(product_id, instance.rating, -1)
+
+
+@receiver(pre_delete, sender=models.OrderItem)
+def detach_reviews_from_rating_stats(sender, instance, **kwargs):
+    # The reviews of a deleted order item are kept with `order_item` set to NULL by
+    # an UPDATE that sends no signals, so they are taken out of the stats here.
+    ratings = models.Review.objects.filter(order_item=instance).values('rating').annotate(n=Count('id'))
+    for row in ratings:
+        models.ProductRatingStats.apply(instance.product_id, row['rating'], -row['n'])
+
+
+@receiver(post_save, sender=models.OrderItem)
+@receiver(post_delete, sender=models.OrderItem)
+def update_order_totals(sender, instance, **kwargs):
+    models.Order(pk=instance.order_id).refresh_totals()
+
+
+@receiver(post_save, sender=models.Product)
+def index_product(sender, instance, **kwargs):
+    search.index_products([instance])
+
+
+@receiver(post_delete, sender=models.Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=models.Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.product_set.select_related('category'))
+
+
+@receiver(post_save, sender=models.ProductImage)
+def queue_image_derivatives(sender, instance, **kwargs):
+    images.queue_derivatives(instance.pk)
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_delete, sender=models.Product)
+@receiver(post_save, sender=models.ProductImage)
+@receiver(post_delete, sender=models.ProductImage)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+@receiver(post_save, sender=models.FeaturedProduct)
+@receiver(post_delete, sender=models.FeaturedProduct)
+@receiver(post_save, sender=models.Review)
+@receiver(post_delete, sender=models.Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    caching.invalidate_catalog()
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def forget_cached_user(sender, instance, **kwargs):
+    authentication.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=models.Customer)
+@receiver(post_delete, sender=models.Customer)
+def forget_cached_customer(sender, instance, **kwargs):
+    authentication.forget_user(instance.user_id)
@@ -0,0 +1,37 @@
+"""
+Content-addressed file storage for product images.
+
+Files are named after the SHA-256 of their bytes, so uploading the same image
+twice stores it once and an unchanged image keeps its URL.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """Return the hex SHA-256 of a file, remembering it on the file object."""
+    digest = getattr(content, 'content_hash', None)
+    if digest is None:
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        content.seek(0)
+        digest = content.content_hash = sha.hexdigest()
+    return digest
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(os.path.dirname(name), digest[:2], digest + extension)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+product_images = ContentAddressedStorage()
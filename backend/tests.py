@@ -1,3 +1,1078 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djoser.utils import encode_uid
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from sb_backend import tasks
+
+from . import authentication, caching, carts, exceptions, expiry, images, inventory, models, payment_notifications, payments, product_io, reservations, search, sequences, views
+from .paginations import KeysetPagination
+
+HOT_TABLES = ('backend_product', 'backend_category', 'backend_order')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Run EXPLAIN on the queries behind the product and order endpoints and fail
+    when one of them scans a whole hot table or sorts it in a temporary b-tree.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [models.Category.objects.create(name=f'Category {i}') for i in range(5)]
+        for i in range(50):
+            models.Product.objects.create(title=f'Product {i}', category=categories[i % 5], unit_price=i * 100)
+
+        cls.staff = models.User.objects.create_user('staff@example.com', 'x', first_name='S', last_name='S', is_staff=True)
+        cls.user = models.User.objects.create_user('user@example.com', 'x', first_name='U', last_name='U')
+        customer = models.Customer.objects.create(user=cls.user, phone='1', address='x')
+        for _ in range(20):
+            models.Order.objects.create(customer=customer)
+        # A history spread over 90 days and every status, so the planner sees
+        # realistic selectivity for time and status filters.
+        statuses = [status for status, _ in models.Order.STATUS_CHOICES]
+        history = models.Order.objects.bulk_create(
+            [models.Order(customer=customer, status=statuses[i % len(statuses)]) for i in range(180)]
+        )
+        now = timezone.now()
+        for i, order in enumerate(history):
+            order.order_time = now - datetime.timedelta(days=90 - i // 2)
+        models.Order.objects.bulk_update(history, ['order_time'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def request(self, params=None, user=None):
+        request = Request(APIRequestFactory().get('/', params or {}))
+        request.user = user or AnonymousUser()
+        return request
+
+    def view_queryset(self, viewset, params=None, user=None):
+        view = viewset(action='list', format_kwarg=None, args=(), kwargs={}, request=self.request(params, user))
+        return view.filter_queryset(view.get_queryset())
+
+    def second_keyset_page(self, viewset, params=None, user=None):
+        """The query for the page after the first, built through the paginator's own cursor."""
+        queryset = self.view_queryset(viewset, params, user)
+        paginator = KeysetPagination()
+        paginator.page_size = 5
+        paginator.paginate_queryset(queryset, self.request(params, user))
+        cursor = parse_qs(urlparse(paginator.get_next_link()).query)[paginator.cursor_query_param][0]
+        return paginator.page_queryset(queryset, self.request({**(params or {}), 'cursor': cursor}, user))
+
+    def assertUsesIndexes(self, queryset, sorted_by_index=True):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            for table in HOT_TABLES:
+                if re.search(rf'\bSCAN {table}\b(?! USING)', line):
+                    self.fail(f"Full scan of {table}:\n{plan}\n{queryset.query}")
+            if sorted_by_index and 'USE TEMP B-TREE FOR ORDER BY' in line:
+                self.fail(f"Unindexed sort:\n{plan}\n{queryset.query}")
+
+    def test_product_list_orderings(self):
+        for params in [{}, {'sort': 'oldest'}, {'price_sort': 'cheap'}, {'price_sort': 'expensive'}]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(self.view_queryset(views.ProductViewSet, params)[:20])
+
+    def test_product_list_by_category(self):
+        for params in [{'category': 'Category 1'}, {'category': 'Category 1', 'price_sort': 'cheap'}]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(self.view_queryset(views.ProductViewSet, params)[:20])
+
+    def test_product_keyset_pages(self):
+        for params in [
+            {}, {'sort': 'oldest'}, {'price_sort': 'cheap'}, {'price_sort': 'expensive'},
+            {'category': 'Category 1'}, {'category': 'Category 1', 'price_sort': 'cheap'},
+        ]:
+            with self.subTest(params=params):
+                self.assertUsesIndexes(self.second_keyset_page(views.ProductViewSet, params))
+
+    def test_product_detail(self):
+        # A slug matches a single row, so sorting the result is free.
+        self.assertUsesIndexes(self.view_queryset(views.ProductViewSet).filter(slug='product-1'), sorted_by_index=False)
+
+    def test_customer_orders(self):
+        self.assertUsesIndexes(self.view_queryset(views.OrderViewSet, user=self.user)[:10])
+        self.assertUsesIndexes(self.second_keyset_page(views.OrderViewSet, user=self.user))
+
+    def test_staff_orders_by_status(self):
+        queryset = self.view_queryset(views.OrderViewSet, {'status': models.Order.STATUS_PROCESSED}, user=self.staff)
+        self.assertUsesIndexes(queryset[:10])
+
+    def test_staff_orders_by_time(self):
+        week_ago = (timezone.localdate() - datetime.timedelta(days=7)).isoformat()
+        month_ago = (timezone.localdate() - datetime.timedelta(days=30)).isoformat()
+        for params in [
+            {'order_time_min': week_ago},
+            {'order_time_min': month_ago, 'order_time_max': week_ago},
+            {'order_time_min': week_ago, 'status': models.Order.STATUS_PROCESSED},
+        ]:
+            with self.subTest(params=params):
+                queryset = self.view_queryset(views.OrderViewSet, params, user=self.staff)
+                # The time range is read from an index; only the rows in it are sorted.
+                self.assertUsesIndexes(queryset[:10], sorted_by_index=False)
+
+
+class QueryCountTests(TestCase):
+    """The queries behind a page must not grow with the number of rows on it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = models.Category.objects.create(name='Tools')
+        cls.user = models.User.objects.create_user('count@example.com', 'x', first_name='C', last_name='C', is_active=True)
+        cls.customer = models.Customer.objects.create(user=cls.user, phone='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_products(self, count):
+        """Products with an image and a review each, as a full product page shows them."""
+        order = models.Order.objects.create(customer=self.customer, status=models.Order.STATUS_COMPLETED)
+        products = []
+        for _ in range(count):
+            product = models.Product.objects.create(
+                title=f'Product {models.Product.objects.count()}', category=self.category, unit_price=100, inventory=100
+            )
+            models.ProductImage.objects.create(product=product, image=f'store/images/{product.pk}.jpg')
+            item = models.OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=100)
+            models.Review.objects.create(order_item=item, rating=4)
+            products.append(product)
+        return products
+
+    def assertQueriesPerPage(self, add_rows, path, sizes=(3, 18)):
+        """Request ``path`` with ``sizes[0]`` rows, then with each further size, and expect the same queries."""
+        add_rows(sizes[0])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        for previous, size in zip(sizes, sizes[1:]):
+            add_rows(size - previous)
+            cache.clear()
+            with self.assertNumQueries(len(queries)):
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+    def add_cart_items(self, count):
+        cart, _ = models.Cart.objects.get_or_create(customer=self.customer)
+        models.CartItem.objects.bulk_create([
+            models.CartItem(cart=cart, product=product, quantity=1) for product in self.add_products(count)
+        ])
+
+    def add_orders(self, count):
+        products = self.add_products(3)
+        for _ in range(count):
+            order = models.Order.objects.create(customer=self.customer)
+            models.OrderItem.objects.bulk_create([
+                models.OrderItem(order=order, product=product, quantity=1, unit_price=100) for product in products
+            ])
+
+    def test_product_page(self):
+        self.assertQueriesPerPage(self.add_products, '/products/')
+
+    def test_cart(self):
+        for storage in ['db', 'cache']:
+            with self.subTest(storage=storage), override_settings(CART_STORAGE=storage):
+                models.Cart.objects.all().delete()
+                cache.clear()
+                self.assertQueriesPerPage(self.add_cart_items, '/cart-items/', sizes=(1, 50))
+
+    def test_order_list(self):
+        # The second request gets a full page of ten orders.
+        self.assertQueriesPerPage(self.add_orders, '/orders/', sizes=(2, 10))
+
+
+class RatingStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.product = models.Product.objects.create(title='Hammer', category=category, unit_price=100)
+        user = models.User.objects.create_user('rater@example.com', 'x', first_name='R', last_name='R')
+        cls.customer = models.Customer.objects.create(user=user, phone='1', address='x')
+
+    def review(self, rating):
+        order = models.Order.objects.create(customer=self.customer, status=models.Order.STATUS_COMPLETED)
+        item = models.OrderItem.objects.create(order=order, product=self.product, quantity=1, unit_price=100)
+        return models.Review.objects.create(order_item=item, rating=rating)
+
+    def stats(self):
+        stats = models.ProductRatingStats.objects.get(product=self.product)
+        return stats.count, stats.total, stats.histogram
+
+    def test_reviews_maintain_the_stats(self):
+        first, second = self.review(5), self.review(3)
+        self.assertEqual(self.stats(), (2, 8, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1}))
+
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.stats(), (2, 4, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0}))
+
+        # Saving without a change counts nothing twice.
+        first.comment = 'Broke on day one'
+        first.save()
+        self.assertEqual(self.stats(), (2, 4, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0}))
+
+        second.delete()
+        self.assertEqual(self.stats(), (1, 1, {1: 1, 2: 0, 3: 0, 4: 0, 5: 0}))
+
+    def test_deleted_order_item_takes_its_review_out(self):
+        review = self.review(4)
+        review.order_item.delete()
+        review.refresh_from_db()
+        self.assertIsNone(review.order_item)
+        self.assertEqual(self.stats(), (0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}))
+
+        # The orphaned review no longer belongs to any product's stats.
+        review.delete()
+        self.assertEqual(self.stats(), (0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}))
+
+    def test_rebuild_check_reports_drift(self):
+        self.review(5), self.review(2)
+        call_command('rebuild_rating_stats', '--check', stdout=StringIO())
+
+        models.ProductRatingStats.objects.filter(product=self.product).update(count=3)
+        with self.assertRaisesMessage(CommandError, f'[{self.product.pk}]'):
+            call_command('rebuild_rating_stats', '--check', stdout=StringIO())
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        call_command('rebuild_rating_stats', '--check', stdout=StringIO())
+        self.assertEqual(self.stats(), (2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+
+@override_settings(ORDER_NUMBER_BLOCK_SIZE=3)
+class OrderNumberTests(TransactionTestCase):
+    # Not a TestCase: blocks are only reserved outside of a transaction.
+    day = datetime.date(2026, 1, 1)
+
+    def setUp(self):
+        self.allocator = sequences.OrderNumberAllocator()
+
+    def last_value(self, day):
+        return models.OrderNumberSequence.objects.get(day=day).last_value
+
+    def test_numbers_come_from_reserved_blocks(self):
+        self.assertEqual([self.allocator.next_value(self.day) for _ in range(4)], [1, 2, 3, 4])
+        self.assertEqual(self.last_value(self.day), 6)
+        # Another process reserves the block after this one's.
+        self.assertEqual(sequences.OrderNumberAllocator().next_value(self.day), 7)
+        self.assertEqual(self.allocator.next_value(self.day), 5)
+
+    def test_new_day_starts_a_new_sequence(self):
+        self.allocator.next_value(self.day)
+        next_day = self.day + datetime.timedelta(days=1)
+        self.assertEqual(self.allocator.next_value(next_day), 1)
+        self.assertEqual((self.last_value(self.day), self.last_value(next_day)), (3, 3))
+
+    def test_single_numbers_inside_a_transaction(self):
+        with transaction.atomic():
+            self.assertEqual(self.allocator.next_value(self.day), 1)
+            self.assertEqual(self.last_value(self.day), 1)
+        try:
+            with transaction.atomic():
+                self.allocator.next_value(self.day)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        # The rolled back number was never handed out for good, and no block was kept.
+        self.assertEqual(self.allocator.next_value(self.day), 2)
+        self.assertEqual(self.last_value(self.day), 4)
+
+    def test_order_number_format_and_exhaustion(self):
+        today = timezone.localdate()
+        self.assertEqual(self.allocator.next_order_number(), f'ORD{today:%Y%m%d}-000001')
+
+        models.OrderNumberSequence.objects.filter(day=today).update(last_value=sequences.MAX_SUFFIX - 1)
+        allocator = sequences.OrderNumberAllocator()
+        self.assertEqual(allocator.next_order_number(), f'ORD{today:%Y%m%d}-999999')
+        with self.assertRaises(exceptions.OrderNumbersExhausted):
+            allocator.next_order_number()
+
+
+class ProductImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = models.Category.objects.create(name='Tools')
+        cls.staff = models.User.objects.create_user('images@example.com', 'x', first_name='I', last_name='I', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def image_bytes(self, size=(300, 200), color='red', image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, image_format)
+        return buffer.getvalue()
+
+    def base64_image(self, **kwargs):
+        return base64.b64encode(self.image_bytes(**kwargs)).decode()
+
+    def create_product(self, *uploads):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/products/create_product/', {
+                'title': 'Hammer', 'category': self.category.pk, 'unit_price': 100, 'inventory': 1,
+                'uploaded_images': list(uploads),
+            }, format='json')
+
+    def test_upload_renders_derivatives(self):
+        response = self.create_product(self.base64_image())
+        self.assertEqual(response.status_code, 201)
+        product_image = models.ProductImage.objects.get()
+        widths = {size: entry['width'] for size, entry in product_image.derivatives.items()}
+        # A 300 pixel wide source is not scaled up for the card and full sizes.
+        self.assertEqual(widths, {'thumbnail': 160, 'card': 300, 'full': 300})
+
+        srcset = self.client.get(f"/products/{response.data['slug']}/").data['images'][0]['srcset']
+        self.assertEqual(re.findall(r' (\d+)w', srcset), ['160', '300'])
+
+    def update_product(self, slug, *uploads):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(f'/products/{slug}/update_product/', {'uploaded_images': list(uploads)}, format='json')
+
+    def test_unchanged_images_keep_their_rows_and_urls(self):
+        red, blue = self.base64_image(color='red'), self.base64_image(color='blue')
+        slug = self.create_product(red).data['slug']
+        before = models.ProductImage.objects.get()
+
+        self.assertEqual(self.update_product(slug, red, blue).status_code, 200)
+        after = models.ProductImage.objects.get(pk=before.pk)
+        self.assertEqual((after.image.name, after.derivatives), (before.image.name, before.derivatives))
+        self.assertEqual(models.ProductImage.objects.count(), 2)
+
+        blue_id = models.ProductImage.objects.exclude(pk=before.pk).get().pk
+        self.update_product(slug, blue)
+        self.assertEqual(list(models.ProductImage.objects.values_list('pk', flat=True)), [blue_id])
+
+    def test_duplicate_uploads_are_stored_once(self):
+        red = self.base64_image()
+        self.create_product(red, red)
+        self.create_product(red)
+        names = set(models.ProductImage.objects.values_list('image', flat=True))
+        self.assertEqual((models.ProductImage.objects.count(), len(names)), (2, 1))
+
+    def test_derivatives_are_queued_without_returned_ids(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self.create_product(self.base64_image(color='red'), self.base64_image(color='blue'))
+        self.assertEqual(models.ProductImage.objects.filter(derivatives={}).count(), 0)
+
+    def png_header(self, width, height):
+        """A tiny PNG whose header claims ``width`` x ``height`` pixels."""
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        ihdr = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', zlib.compress(b'\0')) + chunk(b'IEND', b'')
+
+    def test_decompression_bombs_are_rejected(self):
+        bomb = base64.b64encode(self.png_header(20000, 20000)).decode()
+        for uploads in [[bomb], [self.base64_image(), bomb]]:
+            with self.subTest(uploads=len(uploads)), self.assertLogs('django.request', 'WARNING'):
+                response = self.create_product(*uploads)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('too large', str(response.data['uploaded_images']))
+        self.assertFalse(models.Product.objects.exists())
+
+        # Headers between one and two times Pillow's limit only warn, unless warnings are errors.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with self.assertRaisesMessage(ValueError, 'too large'):
+                images.inspect(BytesIO(self.png_header(10000, 10000)))
+
+    def test_missing_derivatives_are_swept_up(self):
+        # As if the task sent for the upload was lost.
+        with mock.patch.object(images, 'queue_derivatives'):
+            self.create_product(self.base64_image())
+        self.assertEqual(models.ProductImage.objects.get().derivatives, {})
+
+        self.assertEqual(tasks.generate_missing_image_derivatives.delay().get(), 'Rendered derivatives for 1 images.')
+        self.assertEqual(set(models.ProductImage.objects.get().derivatives), {'thumbnail', 'card', 'full'})
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tools = models.Category.objects.create(name='Tools')
+        models.Product.objects.create(title='Hammer', sku='HM-1', category=cls.tools, unit_price=100, inventory=3)
+        cls.staff = models.User.objects.create_user('import@example.com', 'x', first_name='I', last_name='I', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    csv_rows = (
+        'sku,title,category,unit_price,inventory\n'
+        'HM-1,Claw hammer,,150,3\n'           # An empty category leaves it as it is.
+        'SW-1,Saw,Garden,200,4\n'
+        ',Nameless,Tools,1,1\n'               # No sku.
+        'DR-1,Drill,Tools,-5,1\n'             # Negative price.
+        'NT-1,,Tools,10,1\n'                  # New products need a title.
+        'SH-1,Shovel,Garden,300,2\n'
+        'SW-1,Saw blade,Garden,250,4\n'       # Updates the saw created two batches before.
+    )
+
+    def products(self):
+        return {
+            sku: (title, category, unit_price, inventory)
+            for sku, title, category, unit_price, inventory in models.Product.objects.values_list(
+                'sku', 'title', 'category__name', 'unit_price', 'inventory'
+            )
+        }
+
+    def test_import_upserts_by_sku(self):
+        # Run as on databases that return no ids from bulk inserts.
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            report = product_io.import_products(product_io.read_rows(StringIO(self.csv_rows), 'csv'), batch_size=3)
+
+        self.assertEqual((report.rows, report.created, report.updated, report.rejected, report.batches), (7, 2, 2, 3, 3))
+        self.assertEqual([error['row'] for error in report.errors], [3, 4, 5])
+        self.assertEqual(self.products(), {
+            'HM-1': ('Claw hammer', 'Tools', 150, 3),
+            'SW-1': ('Saw blade', 'Garden', 250, 4),
+            'SH-1': ('Shovel', 'Garden', 300, 2),
+        })
+        self.assertEqual(models.Category.objects.filter(name='Garden').count(), 1)
+        self.assertEqual([product.sku for product in search.search(models.Product.objects.all(), 'shovel')], ['SH-1'])
+
+    def test_import_and_export_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        upload = SimpleUploadedFile('products.jsonl', b'{"sku": "SW-1", "title": "Saw", "category": "Tools"}\nnot json\n')
+        response = client.post('/products/import_products/', {'file': upload}, format='multipart')
+        self.assertEqual((response.data['created'], response.data['rejected']), (1, 1))
+
+        for file_format in product_io.FORMATS:
+            with self.subTest(file_format=file_format):
+                response = client.get('/products/export_products/', {'type': file_format})
+                exported = list(product_io.read_rows(StringIO(b''.join(response.streaming_content).decode()), file_format))
+                self.assertEqual(
+                    [(row['sku'], row['title'], row['category'], str(row['unit_price'])) for row in exported],
+                    [('HM-1', 'Hammer', 'Tools', '100'), ('SW-1', 'Saw', 'Tools', '0')],
+                )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tools = models.Category.objects.create(name='Tools')
+        models.Product.objects.create(title='Obeng', sku='OB-1', category=tools, description='bukan palu')
+        models.Product.objects.create(title='Palu besar', sku='PL-1', category=tools, description='palu untuk kayu')
+        models.Product.objects.create(title='Palu kecil', sku='PL-2', category=tools, description='ringan')
+        models.Product.objects.create(title='Lampu', sku='LP-1', category=tools, description='terang')
+
+    def ranked_titles(self, query):
+        return [product.title for product in search.search(models.Product.objects.all(), query)]
+
+    def test_ranking(self):
+        # The token index is exercised too, as on databases without FTS5.
+        for use_fts in ([True] if search.uses_fts() else []) + [False]:
+            with self.subTest(use_fts=use_fts), mock.patch.object(search, '_use_fts', use_fts):
+                search.rebuild_index()
+                self.assertEqual(self.ranked_titles('palu'), ['Palu besar', 'Palu kecil', 'Obeng'])
+                self.assertEqual(self.ranked_titles('pal'), ['Palu besar', 'Palu kecil', 'Obeng'])
+                self.assertEqual(self.ranked_titles('palu ker'), [])
+
+    def test_fts_match_runs_once(self):
+        if not search.uses_fts():
+            self.skipTest("SQLite was built without FTS5")
+        queryset = search.search(models.Product.objects.all(), 'palu')
+        self.assertEqual(str(queryset.query).count('MATCH'), 1)
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.product = models.Product.objects.create(title='Hammer', category=category, unit_price=100, inventory=5)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def cached_responses(self):
+        return [key for key in cache._cache if re.search(r':catalog:\d+:', key)]
+
+    def test_product_list_is_cached_once(self):
+        self.client.get('/products/')
+        self.assertEqual(len(self.cached_responses()), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/products/').status_code, 200)
+
+    def test_keyset_and_numbered_pages_are_cached_apart(self):
+        for order in [('', '?cursor='), ('?cursor=', '')]:
+            with self.subTest(order=order):
+                cache.clear()
+                responses = {query: self.client.get(f'/products/{query}') for query in order}
+                self.assertEqual(list(responses[''].data), ['count', 'next', 'previous', 'results'])
+                self.assertEqual(list(responses['?cursor='].data), ['next', 'results'])
+                self.assertNotEqual(responses['']['ETag'], responses['?cursor=']['ETag'])
+
+    def test_orders_change_stock_without_a_catalog_bump(self):
+        version = caching.catalog_version()
+        self.client.get(f'/products/{self.product.slug}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.decrement_stock({self.product.pk: 2})
+        self.assertEqual(caching.catalog_version(), version)
+        # Shown late, within the refresh interval.
+        self.assertEqual(self.client.get(f'/products/{self.product.slug}/').data['inventory'], 5)
+        with override_settings(CATALOG_STOCK_REFRESH_INTERVAL=0):
+            self.assertEqual(self.client.get(f'/products/{self.product.slug}/').data['inventory'], 3)
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.products = [
+            models.Product.objects.create(title=f'Product {i}', category=category, unit_price=100, inventory=5, limit=3)
+            for i in range(20)
+        ]
+        cls.user = models.User.objects.create_user('checkout@example.com', 'x', first_name='C', last_name='C', is_active=True)
+        cls.customer = models.Customer.objects.create(user=cls.user, phone='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, quantities):
+        cart, _ = models.Cart.objects.get_or_create(customer=self.customer)
+        models.CartItem.objects.bulk_create([
+            models.CartItem(cart=cart, product=product, quantity=quantity) for product, quantity in quantities.items()
+        ])
+        return cart
+
+    def checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/orders/')
+
+    def inventories(self):
+        return list(models.Product.objects.order_by('pk').values_list('inventory', flat=True))
+
+    def test_checkout_takes_the_stock(self):
+        self.fill_cart({self.products[0]: 2, self.products[1]: 1})
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        order = models.Order.objects.get(order_number=response.data['order_number'])
+        self.assertEqual((order.total_price, order.item_count), (300, 3))
+        self.assertEqual(self.inventories()[:3], [3, 4, 5])
+        self.assertFalse(models.Cart.objects.exists())
+
+    def test_short_product_changes_nothing(self):
+        cart = self.fill_cart({self.products[0]: 2, self.products[1]: 6})
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Order.objects.exists())
+        self.assertEqual(self.inventories(), [5] * 20)
+        self.assertEqual(models.CartItem.objects.filter(cart=cart).count(), 2)
+
+    def test_other_carts_holds_count_against_the_stock(self):
+        self.fill_cart({self.products[0]: 3})
+        other_user = models.User.objects.create_user('other@example.com', 'x', first_name='O', last_name='O')
+        other_cart = models.Cart.objects.create(customer=models.Customer.objects.create(user=other_user, phone='2', address='y'))
+        reservations.hold(other_cart.pk, self.products[0].pk, 3)
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.checkout().status_code, 400)
+
+    def test_decrement_stock_never_oversells(self):
+        with self.assertRaises(exceptions.QuantityError), transaction.atomic():
+            inventory.decrement_stock({self.products[0].pk: 5, self.products[1].pk: 6})
+        self.assertEqual(self.inventories()[:2], [5, 5])
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        # The first order of the day also creates the day's order number sequence.
+        models.OrderNumberSequence.objects.create(day=timezone.localdate())
+        self.fill_cart({self.products[0]: 1})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.checkout().status_code, 201)
+        self.fill_cart({product: 1 for product in self.products})
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.checkout().status_code, 201)
+
+    def test_low_stock_is_recorded_when_the_limit_is_crossed(self):
+        first, second = self.products[:2]
+        for quantities in [{first: 1}, {first: 2, second: 2}, {first: 1}]:
+            self.fill_cart(quantities)
+            self.assertEqual(self.checkout().status_code, 201)
+        # 5 -> 4 stays above the limit of 3, 4 -> 2 crosses it, 2 -> 1 was already below.
+        events = list(models.LowStockEvent.objects.values_list('product_id', 'inventory'))
+        self.assertEqual(events, [(first.pk, 2)])
+
+
+class OrderExpiryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.products = [
+            models.Product.objects.create(title=f'Product {i}', category=category, unit_price=100, inventory=10)
+            for i in range(2)
+        ]
+        user = models.User.objects.create_user('late@example.com', 'x', first_name='L', last_name='L')
+        cls.customer = models.Customer.objects.create(user=user, phone='1', address='x')
+
+    def order(self, age, status=models.Order.STATUS_AWAITING_PAYMENT):
+        order = models.Order.objects.create(customer=self.customer, status=status)
+        for quantity, product in enumerate(self.products, start=1):
+            models.OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=100)
+        models.Order.objects.filter(pk=order.pk).update(order_time=timezone.now() - age)
+        return order
+
+    def test_expired_orders_are_cancelled_in_chunks(self):
+        expired = [self.order(datetime.timedelta(minutes=10)) for _ in range(5)]
+        recent = self.order(datetime.timedelta(minutes=1))
+        paid = self.order(datetime.timedelta(minutes=10), status=models.Order.STATUS_PROCESSED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = expiry.expire_pending_orders(chunk_size=2)
+
+        self.assertEqual((report.orders, report.units, report.chunks), (5, 15, 3))
+        self.assertTrue(str(report).startswith('Cancelled 5 pending orders and restored 15 units in 3 chunks'))
+        statuses = dict(models.Order.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[order.pk] for order in expired}, {models.Order.STATUS_CANCELLED})
+        self.assertEqual(statuses[recent.pk], models.Order.STATUS_AWAITING_PAYMENT)
+        self.assertEqual(statuses[paid.pk], models.Order.STATUS_PROCESSED)
+        self.assertEqual(list(models.Product.objects.order_by('pk').values_list('inventory', flat=True)), [15, 20])
+
+    def test_command(self):
+        self.order(datetime.timedelta(minutes=10))
+        out = StringIO()
+        call_command('cancel_pending_orders', '--chunk-size', '10', stdout=out)
+        self.assertIn('Cancelled 1 pending orders and restored 3 units in 1 chunks', out.getvalue())
+        # Nothing is left for a second run.
+        self.assertEqual(expiry.expire_pending_orders().orders, 0)
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.product = models.Product.objects.create(title='Hammer', category=category, unit_price=100, inventory=5)
+        cls.users = [
+            models.User.objects.create_user(f'holder{i}@example.com', 'x', first_name='H', last_name='H', is_active=True)
+            for i in range(2)
+        ]
+        cls.carts = [
+            models.Cart.objects.create(customer=models.Customer.objects.create(user=user, phone='1', address='x'))
+            for user in cls.users
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_holds_of_other_carts_reduce_the_available_stock(self):
+        mine, theirs = self.carts
+        reservations.hold(theirs.pk, self.product.pk, 3)
+        reservations.hold(mine.pk, self.product.pk, 2)
+        # The cart's own hold is replaced, not added to.
+        reservations.hold(mine.pk, self.product.pk, 1)
+        with self.assertRaises(exceptions.QuantityError):
+            reservations.hold(mine.pk, self.product.pk, 3)
+        self.assertEqual(reservations.reserved_quantities([self.product.pk]), {self.product.pk: 4})
+        self.assertEqual(reservations.reserved_quantities([self.product.pk], exclude_cart_id=theirs.pk), {self.product.pk: 1})
+
+    def test_expired_holds_are_ignored_and_released(self):
+        mine, theirs = self.carts
+        reservations.hold(theirs.pk, self.product.pk, 5)
+        models.StockReservation.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        reservations.hold(mine.pk, self.product.pk, 5)
+
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 1 expired', out.getvalue())
+        self.assertEqual(list(models.StockReservation.objects.values_list('cart_id', flat=True)), [mine.pk])
+
+    def test_checkout_does_not_count_the_carts_own_hold(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        self.assertEqual(client.post('/cart-items/', {'product_id': self.product.pk, 'quantity': 5}).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post('/orders/').status_code, 201)
+        self.assertFalse(models.StockReservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 0)
+
+
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('cached@example.com', 'x', first_name='C', last_name='C', is_active=True)
+        models.Customer.objects.create(user=cls.user, phone='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def test_deactivated_user_is_refused(self):
+        self.assertEqual(self.client.get('/customers/me/').status_code, 200)
+        self.assertIsNotNone(cache.get(authentication.user_cache_key(self.user.pk)))
+
+        response = self.client.put(
+            f'/customers/{self.user.pk}/change_user_active_status/',
+            {'user_id': self.user.pk, 'is_active': False}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/customers/me/').status_code, 401)
+
+    def test_promoted_user_is_staff_at_once(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/verify-admin-status/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/verify-admin-status/').status_code, 200)
+
+
+class ActivationTests(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create_user('new@example.com', 'x', first_name='N', last_name='N', is_active=False)
+        self.path = f'/activate/{encode_uid(self.user.pk)}/{default_token_generator.make_token(self.user)}/'
+
+    def test_valid_link_activates_and_redirects_to_login(self):
+        response = self.client.get(self.path)
+        self.assertRedirects(response, 'http://localhost:4200/login', fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_used_link_redirects_home(self):
+        self.client.get(self.path)
+        response = self.client.get(self.path)
+        self.assertRedirects(response, 'http://localhost:4200/', fetch_redirect_response=False)
+
+    def test_malformed_link_redirects_home(self):
+        token = default_token_generator.make_token(self.user)
+        for path in (f'/activate/not-a-uid/{token}/', f'/activate/{encode_uid(self.user.pk)}/not-a-token/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertRedirects(response, 'http://localhost:4200/', fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+
+@override_settings(CART_STORAGE='cache')
+class CartStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.products = [
+            models.Product.objects.create(title=f'Product {i}', category=category, unit_price=100, inventory=5)
+            for i in range(2)
+        ]
+        cls.user = models.User.objects.create_user('cart@example.com', 'x', first_name='C', last_name='C', is_active=True)
+        models.Customer.objects.create(user=cls.user, phone='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for product in self.products:
+            self.client.post('/cart-items/', {'product_id': product.pk, 'quantity': 1})
+        self.item_ids = list(models.CartItem.objects.order_by('pk').values_list('pk', flat=True))
+
+    def set_quantity(self, item_id, quantity):
+        # Background flush jobs are left unrun so the tests decide when to flush.
+        with self.captureOnCommitCallbacks(execute=False):
+            return self.client.patch(f'/cart-items/{item_id}/', {'quantity': quantity}, format='json')
+
+    def quantities(self):
+        return dict(models.CartItem.objects.values_list('pk', 'quantity'))
+
+    def test_flush_writes_quantity_and_reservation(self):
+        self.assertEqual(self.set_quantity(self.item_ids[0], 4).status_code, 200)
+        self.assertEqual(self.client.get(f'/cart-items/{self.item_ids[0]}/').data['quantity'], 4)
+        self.assertEqual(self.quantities()[self.item_ids[0]], 1)
+
+        carts.flush_cart(self.user.pk)
+        self.assertEqual(self.quantities()[self.item_ids[0]], 4)
+        self.assertEqual(models.StockReservation.objects.get(product=self.products[0]).quantity, 4)
+        self.assertFalse(models.CartItem.objects.exclude(pending_quantity=None).exists())
+
+    def test_concurrent_changes_are_all_kept(self):
+        first, second = carts.CartStore(self.user.pk), carts.CartStore(self.user.pk)
+        first.load(), second.load()
+        first.set_quantity(self.item_ids[0], 2)
+        second.set_quantity(self.item_ids[1], 3)
+        self.assertEqual([item['quantity'] for item in first.items()], [2, 3])
+
+        carts.flush_cart(self.user.pk)
+        self.assertEqual(self.quantities(), {self.item_ids[0]: 2, self.item_ids[1]: 3})
+
+    def test_eviction_keeps_pending_changes(self):
+        self.set_quantity(self.item_ids[0], 3)
+        cache.clear()
+        self.assertEqual(self.client.get(f'/cart-items/{self.item_ids[0]}/').data['quantity'], 3)
+
+        carts.flush_cart(self.user.pk)
+        self.assertEqual(self.quantities()[self.item_ids[0]], 3)
+
+    def test_checkout_conflict(self):
+        self.assertEqual(self.set_quantity(self.item_ids[0], 5).status_code, 200)
+        # Someone else takes the stock before the change is written behind.
+        models.Product.objects.filter(pk=self.products[0].pk).update(inventory=2)
+        carts.flush_cart(self.user.pk)
+
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.post('/orders/')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(models.Order.objects.exists())
+        self.assertEqual(self.client.get(f'/cart-items/{self.item_ids[0]}/').data['quantity'], 5)
+
+        self.set_quantity(self.item_ids[0], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/orders/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Order.objects.get().item_count, 3)
+
+
+class SalesRollupTests(TestCase):
+    def test_cancel_reverses_the_category_credited_at_payment(self):
+        tools, garden = models.Category.objects.create(name='Tools'), models.Category.objects.create(name='Garden')
+        product = models.Product.objects.create(title='Shovel', category=tools, unit_price=100)
+        user = models.User.objects.create_user('sales@example.com', 'x', first_name='S', last_name='S')
+        order = models.Order.objects.create(customer=models.Customer.objects.create(user=user, phone='1', address='x'))
+        models.OrderItem.objects.create(order=order, product=product, quantity=2, unit_price=100)
+
+        order.complete_payment()
+        product.category = garden
+        product.save()
+        order.cancel()
+
+        rollups = dict(models.DailyCategorySales.objects.values_list('category__name', 'units'))
+        self.assertEqual(rollups, {'Tools': 0})
+
+
+class PaymentNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = models.Category.objects.create(name='Tools')
+        cls.product = models.Product.objects.create(title='Hammer', category=category, unit_price=5000, inventory=3)
+        user = models.User.objects.create_user('payer@example.com', 'x', first_name='P', last_name='P')
+        cls.customer = models.Customer.objects.create(user=user, phone='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.order = models.Order.objects.create(customer=self.customer, total_price=10000, item_count=2)
+        models.OrderItem.objects.create(order=self.order, product=self.product, quantity=2, unit_price=5000)
+
+    def notification(self, transaction_status, status_code='200', gross_amount='10000.00', **extra):
+        order_id = self.order.order_number
+        return {
+            'order_id': order_id, 'status_code': status_code, 'gross_amount': gross_amount,
+            'transaction_status': transaction_status, 'transaction_id': 'tx-1', 'fraud_status': 'accept',
+            'signature_key': payment_notifications.signature(order_id, status_code, gross_amount),
+            **extra,
+        }
+
+    def deliver(self, *notifications, format='json'):
+        # Drains are run by hand instead of in the background job queue.
+        with self.captureOnCommitCallbacks(execute=False):
+            responses = [self.client.post('/midtrans/notification/', body, format=format) for body in notifications]
+        payment_notifications.drain()
+        self.order.refresh_from_db()
+        return responses
+
+    def test_bad_signature_is_rejected(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response, = self.deliver(self.notification('settlement', signature_key='0' * 128))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(models.PaymentNotification.objects.exists())
+        self.assertEqual(self.order.status, models.Order.STATUS_AWAITING_PAYMENT)
+
+    def test_settlement_pays_the_order_once(self):
+        first, repeat = self.deliver(self.notification('settlement'), self.notification('settlement'))
+        self.assertEqual((first.data['status'], repeat.data['status']), ('received', 'duplicate'))
+        self.assertEqual(models.PaymentNotification.objects.get().outcome, 'paid')
+        self.assertEqual(self.order.status, models.Order.STATUS_PROCESSED)
+        self.assertEqual(models.DailyProductSales.objects.get().orders, 1)
+
+    def test_wrong_amount_is_not_applied(self):
+        self.deliver(self.notification('settlement', gross_amount='100.00'))
+        self.assertEqual(models.PaymentNotification.objects.get().outcome, 'amount mismatch')
+        self.assertEqual(self.order.status, models.Order.STATUS_AWAITING_PAYMENT)
+
+    def test_periodic_drain_applies_notifications_a_lost_drain_left(self):
+        # The drain job queued by the webhook never runs.
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post('/midtrans/notification/', self.notification('settlement'), format='json')
+        self.assertIsNone(models.PaymentNotification.objects.get().processed_at)
+
+        self.assertEqual(tasks.process_payment_notifications.delay().get(), 'Applied 1 payment notifications.')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, models.Order.STATUS_PROCESSED)
+        out = StringIO()
+        call_command('process_payment_notifications', stdout=out)
+        self.assertIn('Applied 0 payment', out.getvalue())
+
+    def test_cancel_restores_stock(self):
+        # Midtrans may post form-encoded notifications as well as JSON.
+        self.deliver(self.notification('cancel', status_code='202'), format='multipart')
+        self.assertEqual(models.PaymentNotification.objects.get().payload['order_id'], self.order.order_number)
+        self.assertEqual(self.order.status, models.Order.STATUS_CANCELLED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+
+
+class StubSnapServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Midtrans Snap API. Each request takes the next
+    ``(status, delay)`` from ``replies``, or succeeds at once when none are left.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSnapHandler)
+        self.replies = []
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/snap/v1'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out hang up mid-reply; that is what the tests want.
+        pass
+
+
+class StubSnapHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, body))
+        status, delay = self.server.replies.pop(0) if self.server.replies else (201, 0)
+        time.sleep(delay)
+        order_id = body['transaction_details']['order_id']
+        reply = {'token': f'token-{order_id}', 'redirect_url': f'https://pay.example/{order_id}'}
+        if status >= 400:
+            reply = {'error_messages': ['stub failure']}
+        payload = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class SnapClientTests(SimpleTestCase):
+    params = {'transaction_details': {'order_id': 'ORD1', 'gross_amount': 1000}}
+
+    def client_for(self, server, **overrides):
+        options = {'server_key': 'key', 'base_url': server.url, 'timeout': (1, 1), 'retries': 2, 'pool_size': 2}
+        return payments.SnapClient(**{**options, **overrides})
+
+    def test_create_transaction(self):
+        with StubSnapServer() as server:
+            result = self.client_for(server).create_transaction(self.params)
+        self.assertEqual(result['token'], 'token-ORD1')
+        self.assertEqual(server.requests, [('/snap/v1/transactions', self.params)])
+
+    def test_retries_unavailable_gateway(self):
+        with StubSnapServer() as server:
+            server.replies = [(503, 0), (502, 0)]
+            result = self.client_for(server).create_transaction(self.params)
+        self.assertEqual(result['token'], 'token-ORD1')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_slow_gateway_times_out_without_retry(self):
+        with StubSnapServer() as server:
+            server.replies = [(201, 0.5)]
+            with self.assertRaises(exceptions.PaymentGatewayError):
+                self.client_for(server, timeout=(1, 0.1)).create_transaction(self.params)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_async_variant(self):
+        with StubSnapServer() as server, override_settings(MIDTRANS_SNAP_URL=server.url):
+            payments.reset_client()
+            self.addCleanup(payments.reset_client)
+            result = async_to_sync(payments.create_transaction_async)(self.params)
+        self.assertEqual(result['redirect_url'], 'https://pay.example/ORD1')
+
+
+class SnapTokenViewTests(TestCase):
+    body = {'transaction_details': {'order_number': 'ORD2', 'total_price': 5000}}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.User.objects.create_user('buyer@example.com', 'x', first_name='B', last_name='B', is_active=True)
+        models.Customer.objects.create(user=cls.user, phone='0812', address='x')
+
+    def setUp(self):
+        cache.clear()
+        self.server = StubSnapServer().__enter__()
+        self.addCleanup(self.server.__exit__)
+        settings_override = override_settings(MIDTRANS_SNAP_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        payments.reset_client()
+        self.addCleanup(payments.reset_client)
+
+    def test_sync_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/midtrans/snap/token/', self.body, format='json')
+        self.server.replies = [(500, 0)]
+        with self.assertLogs('django.request', 'ERROR'):
+            failed = client.post('/midtrans/snap/token/', self.body, format='json')
+        self.assertEqual(response.data['transaction_token'], 'token-ORD2')
+        self.assertEqual(self.server.requests[0][1]['customer_details']['phone'], '0812')
+        self.assertEqual(failed.status_code, 502)
+
+    def test_async_view(self):
+        @async_to_sync
+        async def post(**headers):
+            return await AsyncClient().post(
+                '/midtrans/snap/token/async/', self.body, content_type='application/json', headers=headers
+            )
+
+        token = AccessToken.for_user(self.user)
+        response = post(Authorization=f'JWT {token}')
+        self.server.replies = [(500, 0)]
+        with self.assertLogs('django.request', 'WARNING'):
+            failed = post(Authorization=f'JWT {token}')
+            anonymous = post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['transaction_token'], 'token-ORD2')
+        self.assertEqual(self.server.requests[0][1]['customer_details']['phone'], '0812')
+        self.assertEqual(failed.status_code, 502)
+        self.assertEqual(anonymous.status_code, 401)
@@ -6,6 +6,8 @@ from . import views
 urlpatterns = [
     path('create-user-customer/', views.CreateUserCustomer.as_view(), name='create-user-customer'),
     path('midtrans/snap/token/', views.Transaction.as_view(), name='midtrans_snap_token'),
+    path('midtrans/snap/token/async/', views.snap_token, name='midtrans_snap_token_async'),
+    path('midtrans/notification/', views.PaymentNotificationView.as_view(), name='midtrans_notification'),
     path('verify-admin-status/', views.VerifyAdminStatusView.as_view(), name='verify_admin_status'),
     path('products/<slug:slug>/update_product/', views.ProductViewSet.as_view({'put': 'update_product'}), name='update_product'),
     path('products/', views.ProductViewSet.as_view({'get': 'search_product'}), name='product-search'),
@@ -29,5 +31,6 @@ router.register('customers', views.CustomerViewSet, basename='customers')
 router.register('cart-items', views.CartItemViewSet, basename='cart-items')
 router.register('orders', views.OrderViewSet, basename='orders')
 router.register('reviews', views.ReviewViewSet, basename='reviews')
+router.register('sales', views.SalesViewSet, basename='sales')
 
 urlpatterns += router.urls
\ No newline at end of file
@@ -1,47 +1,61 @@
+import codecs
+from contextlib import contextmanager
+from dataclasses import asdict
 from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from rest_framework import viewsets, permissions, status, mixins, generics
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .serializers import UserCreateSerializer
-from . import models, serializers, filters
-from django.db.models import Q, Count
-from .paginations import PageNumberPagination
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.http import Http404
+from . import caching, carts, exceptions, inventory, models, notifications, order_export, payment_notifications, payments, product_io, reservations, resolvers, search, serializers, filters
+from django.db.models import Q, Count, Prefetch, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from .paginations import KeysetPaginationMixin, PageNumberPagination
+from .caching import cache_catalog_response
+from .sequences import order_numbers
+from .authentication import CachedJWTAuthentication
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from djoser import signals as djoser_signals, views as djoser_views
+from djoser.compat import get_user_email
+from djoser.conf import settings as djoser_settings
 from django.shortcuts import redirect
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
-from datetime import timedelta
-from django.utils import timezone
-import requests
-import midtransclient
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 def activate_account(request, uid, token):
-    activation_url = f"http://127.0.0.1:8000/auth/users/activation/"
-    data = {
-        "uid": uid,
-        "token": token,
-    }
-    print(uid)
-    print(token)
-    
-    response = requests.post(activation_url, data=data)
-    
-    if response.status_code == 204:  # Account activated successfully
+    # Check the link and activate here, the way djoser's activation endpoint
+    # does, instead of posting to that endpoint over HTTP from this worker.
+    serializer = djoser_settings.SERIALIZERS.activation(
+        data={"uid": uid, "token": token},
+        context={"request": request, "view": djoser_views.UserViewSet},
+    )
+    try:
+        is_valid = serializer.is_valid()
+    except PermissionDenied:  # The account is already active
+        is_valid = False
+
+    if is_valid:  # Account activated successfully
+        user = serializer.user
+        user.is_active = True
+        user.save()
+        djoser_signals.user_activated.send(sender=djoser_views.UserViewSet, user=user, request=request)
+        if djoser_settings.SEND_CONFIRMATION_EMAIL:
+            djoser_settings.EMAIL.confirmation(request, {"user": user}).send([get_user_email(user)])
         return redirect('http://localhost:4200/login')  # Redirect to your Angular login page
     else:
         # Handle activation error, maybe redirect to an error page
-        return redirect('')
+        return redirect('http://localhost:4200/')
 
 def reset_password(request, uid, token):
     # Assuming your Angular page URL is 'http://localhost:4200/reset'
@@ -55,13 +69,8 @@ class CustomPagination(PageNumberPagination):
 
 
 
-def get_cart_for_user(user):
-    customer = get_object_or_404(models.Customer, user=user)
-    cart, _ = models.Cart.objects.get_or_create(customer=customer)
-    return cart
-
-
-class OrderViewSet(mixins.CreateModelMixin,
+class OrderViewSet(KeysetPaginationMixin,
+                   mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.ListModelMixin,
                    viewsets.GenericViewSet):
@@ -72,68 +81,105 @@ class OrderViewSet(mixins.CreateModelMixin,
   
     def get_queryset(self):
         user = self.request.user
-        queryset = models.Order.objects.all().order_by('-id')
+        # Customers are prefetched rather than joined so the page is still read
+        # in index order.
+        queryset = models.Order.objects.prefetch_related(
+            'customer__user',
+            Prefetch('items', queryset=models.OrderItem.objects.select_related('product').prefetch_related(
+                'review_set',
+                Prefetch('product__images', queryset=models.ProductImage.objects.order_by('pk')),
+            ))
+        ).order_by('-id')
         
         if not user.is_staff:
-            customer = get_object_or_404(models.Customer, user=user)
-            queryset = queryset.filter(customer=customer)
+            queryset = queryset.filter(customer=resolvers.get_customer(self.request))
 
-        # Apply filters from request parameters
-        order_time_min = self.request.query_params.get('order_time_min')
-        if order_time_min:
-            queryset = queryset.filter(order_time__gte=order_time_min)
+        # order_time_min, order_time_max and status are applied by OrderFilter.
+        return queryset
 
-        order_time_max = self.request.query_params.get('order_time_max')
-        if order_time_max:
-            queryset = queryset.filter(order_time__lte=order_time_max)
+    def retrieve(self, request, *args, **kwargs):
+        # Validate the client's copy from one row read: the order's own fields
+        # and the embedded customer's. Items and their products only change
+        # along with the order or with the catalog and stock versions.
+        try:
+            state = (
+                self.get_queryset().prefetch_related(None).filter(pk=kwargs['pk'])
+                .values_list(
+                    'order_time', 'status', 'total_price', 'item_count', 'paid_at',
+                    'customer__phone', 'customer__address', 'customer__user__first_name',
+                    'customer__user__last_name', 'customer__user__email', 'customer__user__is_active',
+                ).first()
+            )
+        except (TypeError, ValueError):
+            state = None
+        if state is None:
+            raise Http404
+        etag = caching.make_etag(kwargs['pk'], *state, caching.catalog_version(), caching.stock_version())
+        # No Last-Modified: customers and users keep no time of their last
+        # change, so only the ETag can tell when the embedded profile changed.
+        response = caching.not_modified(request, etag, None, private=True)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+            caching.set_validators(response, etag, None, private=True)
+        return response
 
-        status = self.request.query_params.get('status')
-        if status:
-            queryset = queryset.filter(status=status)
-        
-        return queryset
-        
     def create(self, request, *args, **kwargs):
-        cart = get_cart_for_user(self.request.user)
-        cart_items = cart.cartitem_set.all()
-
-        if cart_items.count() == 0:
+        cart_store = carts.CartStore(self.request.user.pk)
+        if carts.cache_enabled():
+            # Raises QuantityError (409) when a quantity change the client was
+            # told about can no longer be met, rather than ordering the old one.
+            cart_store.flush()
+        cart = resolvers.get_cart(self.request)
+        quantities = {}
+        if cart is not None:
+            quantities = dict(models.CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+
+        if not quantities:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         
-        notifications_to_send = []
+        # Allocated outside the transaction so the sequence row is not kept locked.
+        order_number = order_numbers.next_order_number()
 
-        with transaction.atomic():
-            order = models.Order.objects.create(customer=cart.customer)
-            
-            order_items = []
-            for cart_item in cart_items:
-                product = cart_item.product
-                if cart_item.quantity > cart_item.product.inventory:
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
-                order_items.append(models.OrderItem(
-                    order=order,
-                    product=cart_item.product,
-                    unit_price=cart_item.product.unit_price,
-                    quantity=cart_item.quantity
-                ))
-                cart_item.delete()
-                product.inventory -= cart_item.quantity
-                product.save()
-                
-                if product.inventory < product.limit:
-                    notifications_to_send.append(product)
-
-            models.OrderItem.objects.bulk_create(order_items, unique_fields=['order', 'product'])
-            cart.delete()
-            admin_users = get_user_model().objects.filter(is_staff=True)
-            recipient_emails = [user.email for user in admin_users]
-
-            for product in notifications_to_send:
-                subject = f"Produk: {product.title}"
-                message = f"Jumlah Stok dari {product.title} sudah melewati limit. Jumlah stok yang ada sekarang: {product.inventory}"
-                send_mail(subject, message, settings.EMAIL_HOST_USER , recipient_emails)
-
-            return Response(data={'order_number': order.order_number}, status=status.HTTP_201_CREATED)
+        try:
+            with transaction.atomic():
+                products = inventory.lock_products(quantities)
+                held = reservations.reserved_quantities(quantities, exclude_cart_id=cart.pk)
+                if len(products) != len(quantities) or any(
+                    quantities[p.pk] > p.inventory - held.get(p.pk, 0) for p in products
+                ):
+                    raise exceptions.QuantityError()
+                inventory.decrement_stock(quantities)
+
+                order_items = [
+                    models.OrderItem(product=product, unit_price=product.unit_price, quantity=quantities[product.pk])
+                    for product in products
+                ]
+                order = models.Order.objects.create(
+                    customer_id=cart.customer_id,
+                    order_number=order_number,
+                    total_price=sum(item.total_price for item in order_items),
+                    item_count=sum(item.quantity for item in order_items),
+                )
+                for item in order_items:
+                    item.order = order
+                models.OrderItem.objects.bulk_create(order_items)
+                # Deleting the cart also removes its items and turns its stock
+                # reservations into the sale just made.
+                cart.delete()
+
+                low_stock = []
+                for product in products:
+                    previous_inventory = product.inventory
+                    product.inventory -= quantities[product.pk]
+                    if product.inventory < product.limit <= previous_inventory:
+                        low_stock.append(product)
+                if low_stock:
+                    transaction.on_commit(lambda: notifications.record_low_stock(low_stock))
+                transaction.on_commit(cart_store.invalidate)
+        except exceptions.QuantityError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(data={'order_number': order.order_number}, status=status.HTTP_201_CREATED)
     
     def complete_payment(self, request, order_id):
         try:
@@ -171,45 +217,38 @@ class OrderViewSet(mixins.CreateModelMixin,
             return Response({"message": "Order has been canceled successfully"}, status=200)
         else:
             return Response({"error": "Order cannot be canceled in the current state"}, status=400)
-        
-    
-        
-    def cancel_pending_orders(self):
-        # Calculate the datetime threshold for checking orders
-        threshold_datetime = timezone.now() - timedelta(minutes=5)
-
-        # Fetch orders that are still in the "awaiting payment" state
-        pending_orders = models.Order.objects.filter(
-            status=models.Order.STATUS_AWAITING_PAYMENT,
-            created_at__lte=threshold_datetime
-        )
-
-        # Loop through pending orders and cancel them
-        for order in pending_orders:
-            # Use the @transition decorator to change status to cancelled
-            if order.status in [models.Order.STATUS_AWAITING_PAYMENT, models.Order.STATUS_PROCESSED]:
-                order.cancel()
-                order.save()
-                # Restore product inventory
-                for order_item in order.orderitem_set.all():
-                    order_item.product.inventory += order_item.quantity
-                    order_item.product.save()
 
-        return len(pending_orders)
-
-    
+    @action(detail=False, methods=["GET"], permission_classes=[IsAdminUser])
+    def export(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in order_export.FORMATS:
+            return Response({'type': [f"Must be one of {', '.join(order_export.FORMATS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        order_filter = filters.OrderFilter(request.query_params, queryset=models.Order.objects.all())
+        if not order_filter.is_valid():
+            raise translate_validation(order_filter.errors)
+
+        response = StreamingHttpResponse(
+            order_export.export_orders(order_filter.qs, file_format), content_type=order_export.CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{file_format}"'
+        return response
 
 
 class CartItemViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        print("get_queryset method is running")
-        return models.CartItem.objects.filter(cart=get_cart_for_user(self.request.user))
+        cart = resolvers.get_cart(self.request)
+        if cart is None:
+            return models.CartItem.objects.none()
+        return models.CartItem.objects.filter(cart=cart).select_related('product').prefetch_related(
+            Prefetch('product__images', queryset=models.ProductImage.objects.order_by('pk'))
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['cart'] = get_cart_for_user(self.request.user)
+        if self.action in ['create', 'update', 'partial_update']:
+            context['cart'] = resolvers.get_cart(self.request, create=self.action == 'create')
         return context
 
     def get_serializer_class(self, *args, **kwargs):
@@ -218,13 +257,75 @@ class CartItemViewSet(viewsets.ModelViewSet):
         else:
             return serializers.CartItemSerializer
 
+    def list(self, request, *args, **kwargs):
+        if carts.cache_enabled():
+            return Response(carts.CartStore(request.user.pk).items())
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if carts.cache_enabled():
+            try:
+                return Response(carts.CartStore(request.user.pk).item(int(kwargs['pk'])))
+            except (KeyError, ValueError):
+                raise Http404
+        return super().retrieve(request, *args, **kwargs)
+
+    def partial_update(self, request, *args, **kwargs):
+        if carts.cache_enabled() and set(request.data) == {'quantity'}:
+            serializer = serializers.WriteCartItemSerializer(data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            try:
+                item = carts.CartStore(request.user.pk).set_quantity(int(kwargs['pk']), serializer.validated_data['quantity'])
+            except (KeyError, ValueError):
+                raise Http404
+            return Response({'id': item['id'], 'product_id': item['product_id'], 'quantity': item['quantity']})
+        return super().partial_update(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with self.cart_write():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with self.cart_write():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, cart_item):
+        with self.cart_write():
+            reservations.release(cart_item.cart_id, [cart_item.product_id])
+            super().perform_destroy(cart_item)
+
+    @contextmanager
+    def cart_write(self):
+        # Database writes start from the cached changes and leave the cache to be reloaded.
+        store = carts.CartStore(self.request.user.pk)
+        if carts.cache_enabled():
+            try:
+                store.flush()
+            except exceptions.QuantityError:
+                # The changes that no longer fit the stock stay pending and are
+                # reported at checkout; they must not block removing the item.
+                pass
+        try:
+            yield
+        finally:
+            store.invalidate()
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = models.Category.objects.annotate(product_count=Count('product'))
     serializer_class = serializers.CategorySerializer
 
-class ProductViewSet(mixins.ListModelMixin,
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+class ProductViewSet(KeysetPaginationMixin,
+                     mixins.ListModelMixin,
                      mixins.RetrieveModelMixin,mixins.CreateModelMixin, viewsets.GenericViewSet):
-    queryset = models.Product.objects.all()
+    queryset = models.Product.objects.with_reviews()
     lookup_field = 'slug'
     filter_backends = [DjangoFilterBackend]
     filterset_class = filters.ProductFilter
@@ -238,39 +339,47 @@ class ProductViewSet(mixins.ListModelMixin,
         else:
             return serializers.ProductSerializer
 
+    # The list is served and cached through `search_product`, which has the /products/ route.
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False)
+    @cache_catalog_response
     def featured(self, request):
-        queryset = models.FeaturedProduct.objects.all()[:8]
+        queryset = models.FeaturedProduct.objects.prefetch_related(
+            Prefetch('product', queryset=models.Product.objects.with_reviews())
+        )[:8]
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    def use_keyset_pagination(self):
+        # Ranked search results have no stable key to seek on.
+        return super().use_keyset_pagination() and not self.request.query_params.get('q', '').strip()
+
+    @cache_catalog_response
     def search_product(self, request):
         target_title = request.query_params.get('q', '').strip()
 
-        print("Search Keyword:", target_title)
+        if not target_title:
+            return super().list(request)
 
-        if target_title:
-            queryset = self.get_queryset()
-            matching_products = [product for product in queryset if target_title.lower() in product.title.lower()]
-            if matching_products:
-                serializer = self.get_serializer(matching_products, many=True)
-                return Response(serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response({'error': f"No products found matching '{target_title}'"}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        queryset = search.search(self.filter_queryset(self.get_queryset()), target_title)
+        page = self.paginate_queryset(queryset)
+        if not page:
+            return Response({'error': f"No products found matching '{target_title}'"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-    
-    @action(detail=False, methods=[ "POST"])  # Add POST to support product creation
+    @action(detail=False, methods=[ "POST"], parser_classes=[JSONParser, MultiPartParser])  # Add POST to support product creation
     def create_product(self, request):
         serializer = serializers.CreateProductSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         product = serializer.save()  # Save the product to the database
         return Response(serializers.ProductSerializer(product).data, status=status.HTTP_201_CREATED)
     
-    @action(detail=False, methods=["PUT"])
+    @action(detail=False, methods=["PUT"], parser_classes=[JSONParser, MultiPartParser])
     def update_product(self, request, slug=None):
         product = self.get_object()  # Get the product using the slug or ID
         serializer = serializers.CreateProductSerializer(product, data=request.data, partial=True)  # Use CreateProductSerializer class
@@ -283,6 +392,28 @@ class ProductViewSet(mixins.ListModelMixin,
         product = self.get_object()  # Get the product using the slug or ID
         product.delete()  # Delete the product
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=["POST"], permission_classes=[IsAdminUser], parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ["A CSV or JSON Lines file is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('type') or product_io.format_for(upload.name)
+        if file_format not in product_io.FORMATS:
+            return Response({'type': [f"Must be one of {', '.join(product_io.FORMATS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = product_io.import_products(product_io.read_rows(codecs.iterdecode(upload, 'utf-8-sig'), file_format))
+        return Response(asdict(report), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["GET"], permission_classes=[IsAdminUser])
+    def export_products(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in product_io.FORMATS:
+            return Response({'type': [f"Must be one of {', '.join(product_io.FORMATS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(product_io.export_products(file_format), content_type=product_io.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -298,17 +429,21 @@ class ProductViewSet(mixins.ListModelMixin,
             )
 
         if category_filter:
-            queryset = queryset.filter(category__name=category_filter)
+            # Resolving the ids first lets the page be read in order from the
+            # (category, sort key) index instead of being sorted after a join.
+            category_ids = list(models.Category.objects.filter(name=category_filter).values_list('id', flat=True))
+            queryset = queryset.filter(category_id__in=category_ids)
 
+        # Every ordering ends in the primary key so keyset pagination has a unique position.
         if sort_param == 'oldest':
-            queryset = queryset.order_by('create_at')
+            queryset = queryset.order_by('create_at', 'id')
         else:
-            queryset = queryset.order_by('-create_at')
+            queryset = queryset.order_by('-create_at', '-id')
 
         if price_sort == 'cheap':
-            queryset = queryset.order_by('unit_price')
+            queryset = queryset.order_by('unit_price', 'id')
         elif price_sort == 'expensive':
-            queryset = queryset.order_by('-unit_price')
+            queryset = queryset.order_by('-unit_price', '-id')
 
         return queryset
     
@@ -342,8 +477,8 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["GET", "PUT", "PATCH"], permission_classes=[permissions.IsAuthenticated])
     def me(self, request):
-        user = request.user
-        customer = get_object_or_404(models.Customer, user_id=user.id)
+        customer = resolvers.get_customer(request)
+        user = customer.user
 
         method = request.method
 
@@ -373,7 +508,9 @@ class CustomerViewSet(viewsets.ModelViewSet):
         customer.user.delete()
 
     def change_user_active_status(self, request, user_id):
-        customer = self.get_object()
+        # Routed with the user's id rather than the customer's pk that get_object() looks up.
+        customer = get_object_or_404(self.get_queryset(), user_id=user_id)
+        self.check_object_permissions(request, customer)
         user_id = request.data.get('user_id')  # Assuming 'user_id' is sent in the request data
 
         if user_id:
@@ -390,6 +527,48 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
 
 
+class SalesViewSet(viewsets.ViewSet):
+    """Sales analytics for staff, read from the daily rollup tables only."""
+    permission_classes = [IsAdminUser]
+
+    TRUNC = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+    def get_params(self, request):
+        serializer = serializers.SalesQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @action(detail=False, methods=["GET"])
+    def revenue(self, request):
+        params = self.get_params(request)
+        rows = (
+            models.DailyCategorySales.objects.filter(day__range=(params['start'], params['end']))
+            .annotate(period=self.TRUNC[params['period']]('day'))
+            .values('period')
+            .annotate(revenue=Sum('revenue'), units=Sum('units'))
+            .order_by('period')
+        )
+        return Response({'start': params['start'], 'end': params['end'], 'period': params['period'], 'results': list(rows)})
+
+    def top(self, request, model, key, fields):
+        params = self.get_params(request)
+        rows = (
+            model.objects.filter(day__range=(params['start'], params['end']))
+            .values(key, *fields)
+            .annotate(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('orders'))
+            .order_by(f"-{params['order_by']}", key)[:params['limit']]
+        )
+        return Response({'start': params['start'], 'end': params['end'], 'results': list(rows)})
+
+    @action(detail=False, methods=["GET"])
+    def top_products(self, request):
+        return self.top(request, models.DailyProductSales, 'product_id', ['product__title', 'product__slug'])
+
+    @action(detail=False, methods=["GET"])
+    def top_categories(self, request):
+        return self.top(request, models.DailyCategorySales, 'category_id', ['category__name'])
+
+
 class ReviewViewSet(viewsets.ModelViewSet):
     class IsPurchasedItemOwner(permissions.BasePermission):
         def has_permission(self, request, view):
@@ -446,49 +625,83 @@ class CreateUserCustomer(generics.CreateAPIView):
             return Response(request.data, status=status.HTTP_201_CREATED)
         
 
+def _snap_request(data):
+    details = data['transaction_details']
+    return details['order_number'], details['total_price']
+
+
 class Transaction(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request, *args, **kwargs):
-        snap = midtransclient.Snap(
-            is_production=False,
-            server_key='SB-Mid-server-9wxNnpOoWkHvRUD3NTSKSe7M',
-            client_key='SB-Mid-client-MHo6kf5ZIKL22nxC'
-        )
-        data = json.loads(request.body)
-        order_id = data['transaction_details']['order_number']
-        gross_amount = data['transaction_details']['total_price']
-        print("Received order_id:", order_id)
-        print("Received gross_amount:", gross_amount)
-        param = {
-            "transaction_details": {
-                "order_id": order_id,
-                "gross_amount": gross_amount
-            },
-            "credit_card": {
-                "secure": True
-            },
-            "customer_details": {
-                "first_name": request.user.first_name,
-                "last_name": request.user.last_name,
-                "email": request.user.email,
-                "phone": request.user.customer.phone
-    }
-        }
-        transaction = snap.create_transaction(param)
-        transaction_token = transaction['token']
-        print('transaction_token:')
-        print(transaction_token)
-        transaction_redirect_url = transaction['redirect_url']
-        print('transaction_redirect_url:')
-        print(transaction_redirect_url)
+        try:
+            order_id, gross_amount = _snap_request(request.data)
+        except (KeyError, TypeError):
+            return Response({"error": "transaction_details.order_number and total_price are required."}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info("Creating Snap transaction for order %s", order_id)
+
+        param = payments.snap_params(order_id, gross_amount, request.user, resolvers.get_customer(request).phone)
+        transaction = payments.create_transaction(param)
         response_data = {
-            'transaction_token': transaction_token,
-            'transaction_redirect_url': transaction_redirect_url
+            'transaction_token': transaction['token'],
+            'transaction_redirect_url': transaction['redirect_url']
         }
         return Response(response_data)
-    
+
+
+class PaymentNotificationView(APIView):
+    """Receives Midtrans HTTP notifications; orders are updated by a background drain."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        # A form-encoded QueryDict would otherwise keep every value in a list.
+        payload = request.data.dict() if hasattr(request.data, 'dict') else request.data
+        if not isinstance(payload, dict) or not all(payload.get(name) for name in payment_notifications.REQUIRED_FIELDS):
+            return Response({"error": "Not a Midtrans notification."}, status=status.HTTP_400_BAD_REQUEST)
+        if not payment_notifications.verify(payload):
+            return Response({"error": "Invalid signature."}, status=status.HTTP_403_FORBIDDEN)
+
+        created = payment_notifications.record(payload)
+        return Response({"status": "received" if created else "duplicate"}, status=status.HTTP_200_OK)
+
+
+def _authenticate_customer(request):
+    result = CachedJWTAuthentication().authenticate(request)
+    if result is None:
+        raise NotAuthenticated()
+    request.user = result[0]
+    return resolvers.get_customer(request)
+
+
+async def snap_token(request):
+    """
+    Async twin of `Transaction` for deployments served through sb_backend/asgi.py:
+    the worker is free for other requests while Midtrans answers.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        customer = await sync_to_async(_authenticate_customer)(request)
+    except APIException as error:
+        return JsonResponse({'detail': str(error.detail)}, status=error.status_code)
+    try:
+        order_id, gross_amount = _snap_request(json.loads(request.body))
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "transaction_details.order_number and total_price are required."}, status=400)
+
+    param = payments.snap_params(order_id, gross_amount, customer.user, customer.phone)
+    try:
+        transaction = await payments.create_transaction_async(param)
+    except exceptions.PaymentGatewayError as error:
+        return JsonResponse({'detail': error.detail}, status=error.status_code)
+    return JsonResponse({
+        'transaction_token': transaction['token'],
+        'transaction_redirect_url': transaction['redirect_url']
+    })
+
+
 class HelloWorldView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -496,7 +709,7 @@ class HelloWorldView(APIView):
         return Response(data)
     
 class VerifyAdminStatusView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAdminUser]
 
     def get(self, request):
@@ -0,0 +1,10 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sb_backend.settings')
+
+app = Celery('sb_backend')
+# Every CELERY_* setting, including the beat schedule, comes from Django's settings.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.conf.imports = ['sb_backend.tasks']
@@ -1,8 +1,41 @@
-from backend.views import OrderViewSet
+from backend import expiry, images, notifications, payment_notifications, reservations
 from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def cancel_pending_orders():
-    order_view = OrderViewSet()
-    cancelled_orders_count = order_view.cancel_pending_orders()
-    return f"Cancelled {cancelled_orders_count} pending orders."
+    report = expiry.expire_pending_orders()
+    logger.info("%s", report)
+    return str(report)
+
+
+@shared_task
+def send_low_stock_digest():
+    product_count = notifications.send_low_stock_digest()
+    return f"Sent low stock digest for {product_count} products."
+
+
+@shared_task
+def release_expired_reservations():
+    released_count = reservations.release_expired()
+    return f"Released {released_count} expired stock reservations."
+
+
+@shared_task
+def process_payment_notifications():
+    processed_count = payment_notifications.drain()
+    return f"Applied {processed_count} payment notifications."
+
+
+# Acknowledged only once done, so a render lost with its worker is redelivered.
+@shared_task(acks_late=True)
+def generate_image_derivatives(image_id):
+    images.generate_derivatives(image_id)
+
+
+@shared_task
+def generate_missing_image_derivatives():
+    rendered_count = images.generate_missing_derivatives()
+    return f"Rendered derivatives for {rendered_count} images."
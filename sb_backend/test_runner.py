@@ -0,0 +1,26 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .celery import app as celery_app
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Run the tests against a process-local cache, so they neither read nor
+    write the cache directory that running servers share, and run Celery
+    tasks in the test process instead of sending them to a broker.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        )
+        self._cache_settings.enable()
+        self._always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def teardown_test_environment(self, **kwargs):
+        celery_app.conf.task_always_eager = self._always_eager
+        self._cache_settings.disable()
+        super().teardown_test_environment(**kwargs)